@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""JpegFrameParser 與舊版 bytes 串接切幀邏輯的微基準測試
+
+用法: python bench_mjpeg_parser.py [--frames 300] [--frame-size 40000] [--chunk-size 8192]
+"""
+
+import argparse
+import os
+import time
+
+from mjpeg_parser import JpegFrameParser, SOI_MARKER, EOI_MARKER
+
+
+def make_stream(frames, frame_size):
+    """產生模擬的 MJPEG 串流（payload 中不含 0xFF，避免誤判標記）"""
+    payload = os.urandom(frame_size).replace(b'\xff', b'\xfe')
+    return (SOI_MARKER + payload + EOI_MARKER) * frames
+
+
+def legacy_split(chunks):
+    """舊版邏輯：bytes 串接並每次從頭掃描"""
+    frame_buffer = b''
+    count = 0
+    for data in chunks:
+        frame_buffer += data
+        while True:
+            start_idx = frame_buffer.find(SOI_MARKER)
+            if start_idx == -1:
+                break
+            end_idx = frame_buffer.find(EOI_MARKER, start_idx)
+            if end_idx == -1:
+                break
+            jpeg_frame = frame_buffer[start_idx:end_idx + 2]
+            frame_buffer = frame_buffer[end_idx + 2:]
+            count += 1
+    return count
+
+
+def parser_split(chunks):
+    """新版邏輯：JpegFrameParser"""
+    parser = JpegFrameParser()
+    count = 0
+    for data in chunks:
+        count += len(parser.feed(data))
+    return count
+
+
+def bench(name, func, chunks, total_bytes, repeat):
+    best = float('inf')
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = func(chunks)
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:>8}: {count} 幀, {best * 1000:8.2f} ms, "
+          f"{count / best:10.0f} fps, {total_bytes / best / 1e6:8.1f} MB/s")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--frame-size', type=int, default=40000)
+    parser.add_argument('--chunk-size', type=int, default=8192)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    stream = make_stream(args.frames, args.frame_size)
+    chunks = [stream[i:i + args.chunk_size] for i in range(0, len(stream), args.chunk_size)]
+    print(f"{args.frames} 幀 x {args.frame_size} 位元組, 區塊 {args.chunk_size} 位元組")
+
+    legacy = bench('legacy', legacy_split, chunks, len(stream), args.repeat)
+    current = bench('parser', parser_split, chunks, len(stream), args.repeat)
+    print(f"加速倍數: {legacy / current:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
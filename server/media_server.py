@@ -8,6 +8,12 @@ import signal
 import logging
 import threading
 import subprocess
+import queue
+import uuid
+import select
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, Tuple
 
@@ -41,6 +47,13 @@ logging.getLogger('engineio').setLevel(logging.ERROR)
 # USB 存儲設定
 USB_MOUNT_POINT = "/mnt/usb"
 USB_DEVICE = "/dev/sda1"
+MOUNTINFO_PATH = "/proc/self/mountinfo"
+STORAGE_CHECK_INTERVAL = 2.0  # 掛載表事件之外,檢查 USB 裝置插拔的間隔 (秒)
+
+# 寫入持久化策略,依存儲目標分別設定
+# sync: 回應前 fsync 檔案與所在目錄 / async: 交由背景執行緒 fsync / none: 交由系統回寫
+USB_DURABILITY = os.environ.get("USB_DURABILITY", "sync")
+LOCAL_DURABILITY = os.environ.get("LOCAL_DURABILITY", "async")
 
 # 基本設定與媒體輸出路徑
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -50,6 +63,27 @@ DEFAULT_WIDTH = int(os.environ.get("VIDEO_WIDTH", "1280"))
 DEFAULT_HEIGHT = int(os.environ.get("VIDEO_HEIGHT", "720"))
 DEFAULT_FPS = int(os.environ.get("VIDEO_FPS", "30"))
 
+# 相機工作階段設定
+# off: 只在拍照 / 連拍 / 縮時攝影期間開啟相機 (預設;libcamera 同一相機只能由一個程序開啟,
+#      與 stream_server.py 的 rpicam-vid 串流同時使用時必須為 off)
+# stream: 常駐並持續輸出拍照解析度的串流,拍照直接取下一幀
+# switch: 常駐並以低解析度預覽運行,拍照時切換到拍照模式
+CAMERA_WARM_MODE = os.environ.get("CAMERA_WARM_MODE", "off")
+PREVIEW_WIDTH = int(os.environ.get("PREVIEW_WIDTH", "640"))
+PREVIEW_HEIGHT = int(os.environ.get("PREVIEW_HEIGHT", "480"))
+CAMERA_WARMUP_SECONDS = 0.5  # 相機啟動後等待 AE/AWB 收斂的時間 (僅首次拍照)
+
+# 連拍 / 縮時攝影設定
+CAPTURE_RING_SIZE = int(os.environ.get("CAPTURE_RING_SIZE", "4"))  # 預先配置的幀緩衝區數量
+CAPTURE_ENCODE_WORKERS = int(os.environ.get("CAPTURE_ENCODE_WORKERS", "2"))  # JPEG 編碼/寫檔執行緒數
+CAPTURE_JPEG_QUALITY = int(os.environ.get("CAPTURE_JPEG_QUALITY", "90"))
+BURST_MAX_COUNT = 100
+BURST_MAX_DURATION = 60.0  # 連拍端點同步等待完成,張數 x 間隔不得超過此秒數 (較長的拍攝請用縮時攝影)
+
+# H.264 -> MP4 轉檔工作設定
+REMUX_TIMEOUT = 300  # 單一轉檔工作逾時 (秒)
+REMUX_HISTORY = 50  # 保留的已完成工作數量
+
 # 全局變數用於當前存儲路徑
 current_media_root = None
 current_photos_dir = None
@@ -70,15 +104,32 @@ else:
 
 
 # USB 掛載相關函數
-def is_usb_mounted() -> bool:
+def _unescape_mount_path(path: str) -> str:
+    import re
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), path)
+
+
+def _read_usb_mounted() -> bool:
+    """讀取 /proc/self/mountinfo 判斷 USB 掛載點是否已掛載"""
     try:
-        result = subprocess.run(["mount"], capture_output=True, text=True, check=False, timeout=5)
-        return USB_MOUNT_POINT in result.stdout
+        with open(MOUNTINFO_PATH, "r") as f:
+            for line in f:
+                fields = line.split(" ", 5)
+                # 第 5 欄為掛載點,空白等字元以八進位跳脫 (\040)
+                if len(fields) > 4 and _unescape_mount_path(fields[4]) == USB_MOUNT_POINT:
+                    return True
+        return False
     except Exception as e:
         logger.warning(f"檢查 USB 掛載狀態失敗: {e}")
         return False
 
 
+def is_usb_mounted() -> bool:
+    if storage_monitor.running:
+        return storage_monitor.usb_mounted
+    return _read_usb_mounted()
+
+
 def mount_usb() -> bool:
     try:
         os.makedirs(USB_MOUNT_POINT, exist_ok=True)
@@ -97,10 +148,11 @@ def mount_usb() -> bool:
         return False
 
 
-def unmount_usb() -> bool:
+def unmount_usb(lazy: bool = False) -> bool:
+    """卸載 USB;lazy 為 True 時使用 umount -l,即使仍有開啟中的檔案也立即從掛載表移除"""
     try:
         result = subprocess.run(
-            ["sudo", "umount", USB_MOUNT_POINT],
+            ["sudo", "umount", *(["-l"] if lazy else []), USB_MOUNT_POINT],
             capture_output=True, text=True, check=False, timeout=10
         )
         if result.returncode == 0:
@@ -155,6 +207,175 @@ def init_storage():
             logger.info("⚠️ USB 掛載失敗,使用本地存儲")
 
     current_media_root, current_photos_dir, current_videos_dir = get_storage_paths()
+    storage_monitor.start()
+
+
+def fsync_file(path: str) -> None:
+    """fsync 單一檔案"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_dir(path: str) -> None:
+    """fsync 目錄,讓新建/刪除的目錄項目落盤"""
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # 部分檔案系統 (如 exFAT FUSE) 不支援目錄 fsync
+    finally:
+        os.close(fd)
+
+
+class FlushWorker:
+    """針對性寫入持久化
+
+    只 fsync 剛寫入的檔案與其所在目錄,取代會沖刷所有檔案系統的 os.sync()。
+    依路徑所在存儲目標套用 USB_DURABILITY / LOCAL_DURABILITY,
+    async 策略交由背景執行緒處理,不阻塞 HTTP 回應。
+    """
+
+    def __init__(self) -> None:
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+
+    @staticmethod
+    def policy_for(path: str) -> str:
+        if os.path.abspath(path).startswith(USB_MOUNT_POINT + os.sep):
+            return USB_DURABILITY
+        return LOCAL_DURABILITY
+
+    def persist(self, path: str, removed: bool = False) -> None:
+        """依策略持久化 path;removed 為 True 時只同步其所在目錄 (檔案已刪除)"""
+        policy = self.policy_for(path)
+        if policy == "none":
+            return
+        if policy == "async":
+            self._ensure_thread()
+            self._queue.put((path, removed))
+            return
+        self._flush(path, removed)
+
+    def _flush(self, path: str, removed: bool) -> None:
+        try:
+            if not removed:
+                fsync_file(path)
+            fsync_dir(os.path.dirname(os.path.abspath(path)))
+        except Exception as e:
+            logger.warning(f"檔案同步失敗 {path}: {e}")
+
+    def _ensure_thread(self) -> None:
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            path, removed = self._queue.get()
+            try:
+                self._flush(path, removed)
+            finally:
+                self._queue.task_done()
+
+    def drain(self) -> None:
+        """等待背景同步全部完成 (卸載存儲前呼叫)"""
+        if self._thread is not None:
+            self._queue.join()
+
+
+flush_worker = FlushWorker()
+
+
+class StorageMonitor:
+    """USB 存儲狀態監控
+
+    掛載狀態快取於記憶體,由背景執行緒以 poll() 監看 /proc/self/mountinfo
+    (掛載表變化時核心會發出 POLLPRI);變化時自動重新決定照片/影片目錄。
+    另外定期檢查 USB 裝置節點,插入時自動掛載,拔除時卸載並切回本地存儲。
+    """
+
+    def __init__(self) -> None:
+        self.usb_mounted = False
+        self.running = False
+        self._device_present = False
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._device_present = os.path.exists(USB_DEVICE)
+        self.usb_mounted = _read_usb_mounted() and self._device_present
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        logger.info("🔍 USB 存儲監控已啟動")
+
+    def stop(self) -> None:
+        self.running = False
+        self._stop_event.set()
+
+    def _run(self) -> None:
+        poller = None
+        mountinfo = None
+        try:
+            mountinfo = open(MOUNTINFO_PATH, "r")
+            mountinfo.read()
+            poller = select.poll()
+            poller.register(mountinfo, select.POLLERR | select.POLLPRI)
+        except Exception as e:
+            logger.warning(f"無法監看掛載表,改為定期檢查: {e}")
+
+        try:
+            while not self._stop_event.is_set():
+                if poller:
+                    events = poller.poll(STORAGE_CHECK_INTERVAL * 1000)
+                    if events:
+                        # 重新讀取以清除事件狀態
+                        mountinfo.seek(0)
+                        mountinfo.read()
+                else:
+                    self._stop_event.wait(STORAGE_CHECK_INTERVAL)
+                if self._stop_event.is_set():
+                    break
+                self._check_device()
+                self._refresh()
+        finally:
+            if mountinfo:
+                mountinfo.close()
+
+    def _check_device(self) -> None:
+        """偵測 USB 裝置插拔"""
+        present = os.path.exists(USB_DEVICE)
+        if present == self._device_present:
+            return
+        self._device_present = present
+        if present and not _read_usb_mounted():
+            logger.info("🔌 偵測到 USB 裝置插入,嘗試掛載...")
+            mount_usb()
+        elif not present and _read_usb_mounted():
+            logger.warning("⚠️ USB 裝置已拔除,卸載掛載點")
+            # 錄影或轉檔仍開著 USB 上的檔案時一般卸載會回報 busy,改用 lazy 卸載
+            unmount_usb(lazy=True)
+
+    def _refresh(self) -> None:
+        global current_media_root, current_photos_dir, current_videos_dir
+        # 裝置節點已消失但卸載失敗時,掛載點仍在掛載表中,同樣視為未掛載
+        mounted = _read_usb_mounted() and self._device_present
+        if mounted == self.usb_mounted:
+            return
+        self.usb_mounted = mounted
+        logger.info(f"💾 USB 掛載狀態變更: {'已掛載' if mounted else '未掛載'},重新選擇存儲路徑")
+        current_media_root, current_photos_dir, current_videos_dir = get_storage_paths()
+
+
+storage_monitor = StorageMonitor()
 
 
 def cleanup_resources():
@@ -165,6 +386,15 @@ def cleanup_resources():
             logger.info("✅ 已停止錄影")
         except Exception as e:
             logger.warning(f"停止錄影失敗: {e}")
+    with timelapse_lock:
+        if timelapse_job and timelapse_job.is_running():
+            timelapse_job.stop()
+            timelapse_job.wait(timeout=5)
+    camera_manager.close()
+    storage_monitor.stop()
+    if not remux_queue.drain(timeout=REMUX_TIMEOUT):
+        logger.warning("⚠️ 仍有轉檔工作未完成")
+    flush_worker.drain()
     if is_usb_mounted():
         unmount_usb()
     logger.info("✅ 資源清理完成")
@@ -276,40 +506,335 @@ def _timestamped_filename(prefix: str, ext: str) -> str:
     return f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{ext}"
 
 
-def capture_photo(output_path: Optional[str] = None) -> str:
-    if output_path is None:
-        output_path = os.path.join(current_photos_dir, _timestamped_filename("photo", "jpg"))
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+def _unique_video_basename(base_name: str) -> str:
+    """避開仍在使用中的檔名
 
-    # 優先使用 picamera2
-    if HAS_PICAMERA2:
+    停止錄影後原始 .h264 要等轉檔完成才刪除,同一秒內再次開始錄影時若沿用相同檔名,
+    新錄影會截斷仍在排隊的原始檔,轉檔結束後也會刪掉正在寫入的檔案,因此加上序號。
+    """
+    candidate = base_name
+    suffix = 1
+    while any(os.path.exists(os.path.join(current_videos_dir, f"{candidate}.{ext}")) for ext in ("h264", "mp4")):
+        candidate = f"{base_name}_{suffix}"
+        suffix += 1
+    return candidate
+
+
+class CameraManager:
+    """picamera2 相機工作階段
+
+    常駐模式 (CAMERA_WARM_MODE=stream/switch) 下相機只配置一次並持續運行,AE/AWB 保持收斂,
+    拍照不必重新初始化感光元件;off 模式下相機只在 session() 期間開啟,結束後釋放給其他程序。
+    錄影需要獨佔相機時以 suspend() 釋放,錄影結束後 resume() 在背景重新啟動常駐相機。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._picam2 = None
+        self._still_config = None
+        self._suspended = False
+        self._ready_at = 0.0
+        self._users = 0
+        self.warm = CAMERA_WARM_MODE in ("stream", "switch")
+
+    @contextmanager
+    def session(self):
+        """使用相機期間保持開啟;非常駐模式下最後一個使用者結束時釋放相機"""
+        with self._lock:
+            self._users += 1
         try:
+            yield self
+        finally:
+            with self._lock:
+                self._users -= 1
+                if not self.warm and self._users == 0:
+                    self._close_locked()
+
+    def is_running(self) -> bool:
+        with self._lock:
+            return self._picam2 is not None
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._picam2 is not None,
+                "suspended": self._suspended,
+                "mode": CAMERA_WARM_MODE,
+            }
+
+    def start(self) -> bool:
+        """開啟相機 (已開啟或暫停中時直接返回)"""
+        with self._lock:
+            if self._picam2 is not None:
+                return True
+            if self._suspended or not HAS_PICAMERA2:
+                return False
+
             from picamera2 import Picamera2  # type: ignore
 
-            logger.info(f"📷 picamera2 拍照: {output_path}")
             picam2 = Picamera2()
             try:
-                photo_config = picam2.create_still_configuration(main={"size": (DEFAULT_WIDTH, DEFAULT_HEIGHT)})
-                picam2.configure(photo_config)
+                still_config = picam2.create_still_configuration(main={"size": (DEFAULT_WIDTH, DEFAULT_HEIGHT)})
+                if CAMERA_WARM_MODE == "switch":
+                    picam2.configure(picam2.create_preview_configuration(main={"size": (PREVIEW_WIDTH, PREVIEW_HEIGHT)}))
+                else:
+                    picam2.configure(still_config)
                 picam2.start()
-                time.sleep(0.5)
-                picam2.capture_file(output_path)
-                logger.info(f"✅ picamera2 拍照成功: {output_path}")
-                # 强制写入
-                try:
-                    os.sync()
-                except Exception:
-                    pass
-                return output_path
-            finally:
-                try:
-                    picam2.stop()
-                except Exception:
-                    pass
+            except Exception as exc:
+                logger.warning(f"相機工作階段啟動失敗: {exc}")
                 try:
                     picam2.close()
                 except Exception:
                     pass
+                return False
+
+            self._picam2 = picam2
+            self._still_config = still_config
+            self._ready_at = time.monotonic() + CAMERA_WARMUP_SECONDS
+            logger.info(f"📷 相機工作階段已啟動 (模式: {CAMERA_WARM_MODE})")
+            return True
+
+    def _capture_locked(self, output_path: str) -> None:
+        if not self.start():
+            raise RuntimeError("相機不可用")
+        # 只有剛啟動時需要等待 AE/AWB 收斂
+        remaining = self._ready_at - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        if CAMERA_WARM_MODE == "switch":
+            self._picam2.switch_mode_and_capture_file(self._still_config, output_path)
+        else:
+            self._picam2.capture_file(output_path)
+
+    def capture(self, output_path: str) -> str:
+        """拍攝單張照片"""
+        with self.session(), self._lock:
+            self._capture_locked(output_path)
+        return output_path
+
+    def grab_frame(self, ring: "FrameRing") -> Tuple[int, str]:
+        """擷取一幀到緩衝區環的空閒槽位,回傳 (槽位, 像素格式)
+
+        直接映射相機請求緩衝區並複製到預先配置的陣列,不產生新的影像物件。
+        """
+        from picamera2 import MappedArray  # type: ignore
+
+        with self._lock:
+            if not self.start():
+                raise RuntimeError("相機不可用")
+            remaining = self._ready_at - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+
+            switched = CAMERA_WARM_MODE == "switch"
+            if switched:
+                preview_config = self._picam2.camera_config
+                self._picam2.switch_mode(self._still_config)
+            try:
+                main = self._still_config["main"]
+                width, height = main["size"]
+                request = self._picam2.capture_request()
+                try:
+                    with MappedArray(request, "main") as mapped:
+                        frame = mapped.array[:height, :width]
+                        slot = ring.acquire(frame.shape)
+                        ring.buffers[slot][...] = frame
+                finally:
+                    request.release()
+            finally:
+                if switched:
+                    self._picam2.switch_mode(preview_config)
+            return slot, main["format"]
+
+    def _close_locked(self) -> None:
+        if self._picam2 is None:
+            return
+        try:
+            self._picam2.stop()
+        except Exception:
+            pass
+        try:
+            self._picam2.close()
+        except Exception:
+            pass
+        self._picam2 = None
+        logger.info("📷 相機已釋放")
+
+    def suspend(self) -> None:
+        """暫停並釋放相機 (供錄影獨佔)"""
+        with self._lock:
+            self._suspended = True
+            self._close_locked()
+
+    def resume(self) -> None:
+        """解除暫停,常駐模式下於背景重新啟動相機"""
+        with self._lock:
+            if not self._suspended:
+                return
+            self._suspended = False
+        if self.warm:
+            threading.Thread(target=self.start, daemon=True).start()
+
+    def close(self) -> None:
+        """關閉相機且不再自動啟動 (服務結束時)"""
+        self.suspend()
+
+
+camera_manager = CameraManager()
+
+
+class FrameRing:
+    """預先配置的幀緩衝區環
+
+    擷取端取得空閒槽位寫入,編碼完成後歸還;所有槽位都在編碼中時擷取端會等待,
+    記憶體用量固定為 size 張全幅影像。
+    """
+
+    def __init__(self, size: int = CAPTURE_RING_SIZE) -> None:
+        self.size = size
+        self.buffers: list = []
+        self._shape = None
+        self._free: "queue.Queue[int]" = queue.Queue()
+
+    def acquire(self, shape) -> int:
+        if shape != self._shape:
+            # 第一次使用或解析度改變時配置;等待所有槽位歸還後再重新配置
+            import numpy as np
+
+            for _ in range(len(self.buffers)):
+                self._free.get()
+            self.buffers = [np.empty(shape, dtype=np.uint8) for _ in range(self.size)]
+            self._shape = shape
+            for slot in range(self.size):
+                self._free.put(slot)
+        return self._free.get()
+
+    def release(self, slot: int) -> None:
+        self._free.put(slot)
+
+
+# picamera2 陣列格式對應的 PIL 原始模式
+_PIL_RAW_MODES = {"BGR888": "RGB", "RGB888": "BGR", "XBGR8888": "RGBX", "XRGB8888": "BGRX"}
+
+
+def _encode_jpeg(ring: FrameRing, slot: int, pixel_format: str, output_path: str) -> str:
+    """將緩衝區槽位編碼為 JPEG 並寫檔,完成後歸還槽位 (於編碼執行緒池執行)"""
+    from PIL import Image
+
+    try:
+        frame = ring.buffers[slot]
+        height, width = frame.shape[:2]
+        image = Image.frombuffer("RGB", (width, height), frame, "raw", _PIL_RAW_MODES.get(pixel_format, "RGB"), 0, 1)
+        image.save(output_path, format="JPEG", quality=CAPTURE_JPEG_QUALITY)
+        flush_worker.persist(output_path)
+        return output_path
+    finally:
+        ring.release(slot)
+
+
+class CaptureJob:
+    """連拍 / 縮時攝影工作
+
+    擷取執行緒從相機逐幀複製到 FrameRing,編碼與寫檔交給執行緒池,
+    擷取節奏不受 JPEG 編碼與儲存裝置寫入速度影響。count 為 None 時持續到 stop()。
+    """
+
+    def __init__(self, kind: str, count: Optional[int], interval: float) -> None:
+        self.id = uuid.uuid4().hex[:8]
+        self.kind = kind
+        self.count = count
+        self.interval = interval
+        self.files: list = []
+        self.captured = 0
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.state = "running"
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        if self._thread:
+            self._thread.join(timeout)
+
+    def is_running(self) -> bool:
+        return self.state == "running"
+
+    def status(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "count": self.count,
+            "interval_ms": int(self.interval * 1000),
+            "captured": self.captured,
+            "files": list(self.files),
+            "started_at": self.started_at,
+            "error": self.error,
+        }
+
+    def _run(self) -> None:
+        # 加上工作 id,同一秒內的多個工作不會互相覆寫
+        prefix = f"{self.kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{self.id}"
+        futures = []
+        try:
+            # 相機只在擷取期間保持開啟,幀已複製到 FrameRing,編碼不需佔用相機
+            with camera_manager.session():
+                next_shot = time.monotonic()
+                while self.count is None or self.captured < self.count:
+                    if self._stop_event.wait(max(0.0, next_shot - time.monotonic())):
+                        break
+                    next_shot = time.monotonic() + self.interval
+                    slot, pixel_format = camera_manager.grab_frame(capture_ring)
+                    output_path = os.path.join(current_photos_dir, f"{prefix}_{self.captured:04d}.jpg")
+                    futures.append(encode_pool.submit(_encode_jpeg, capture_ring, slot, pixel_format, output_path))
+                    self.captured += 1
+                    # 縮時攝影持續執行,已完成的檔案即時列入結果
+                    while futures and futures[0].done():
+                        self.files.append(futures.pop(0).result())
+            for future in futures:
+                self.files.append(future.result())
+            self.state = "stopped" if self._stop_event.is_set() else "done"
+            logger.info(f"✅ {self.kind} 工作 {self.id} 結束: {len(self.files)} 張")
+        except Exception as exc:
+            # 等待已送出的編碼完成,讓槽位全部歸還
+            for future in futures:
+                if future.exception() is None:
+                    self.files.append(future.result())
+            self.error = str(exc)
+            self.state = "error"
+            logger.exception(f"{self.kind} 工作 {self.id} 失敗")
+
+
+capture_ring = FrameRing()
+encode_pool = ThreadPoolExecutor(max_workers=CAPTURE_ENCODE_WORKERS, thread_name_prefix="jpeg-encode")
+
+# 目前的縮時攝影工作
+timelapse_lock = threading.Lock()
+timelapse_job: Optional[CaptureJob] = None
+
+
+def capture_photo(output_path: Optional[str] = None) -> str:
+    if output_path is None:
+        output_path = os.path.join(current_photos_dir, _timestamped_filename("photo", "jpg"))
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    # 優先使用 picamera2 工作階段
+    if HAS_PICAMERA2:
+        try:
+            logger.info(f"📷 picamera2 拍照: {output_path}")
+            camera_manager.capture(output_path)
+            logger.info(f"✅ picamera2 拍照成功: {output_path}")
+            flush_worker.persist(output_path)
+            return output_path
         except Exception as exc:
             logger.warning(f"picamera2 拍照失敗,嘗試其他方法: {exc}")
 
@@ -317,10 +842,7 @@ def capture_photo(output_path: Optional[str] = None) -> str:
         cmd = ["libcamera-still", "-n", "-o", output_path, "--width", str(DEFAULT_WIDTH), "--height", str(DEFAULT_HEIGHT)]
         logger.info(f"📷 libcamera 拍照: {' '.join(map(str, cmd))}")
         subprocess.check_call(cmd)
-        try:
-            os.sync()
-        except Exception:
-            pass
+        flush_worker.persist(output_path)
         return output_path
 
     if HAS_FFMPEG:
@@ -329,10 +851,7 @@ def capture_photo(output_path: Optional[str] = None) -> str:
                "-vframes", "1", "-pix_fmt", "yuvj420p", output_path]
         logger.info(f"📷 ffmpeg 拍照: {' '.join(map(str, cmd))}")
         subprocess.check_call(cmd)
-        try:
-            os.sync()
-        except Exception:
-            pass
+        flush_worker.persist(output_path)
         return output_path
 
     # Fallback to OpenCV
@@ -349,16 +868,158 @@ def capture_photo(output_path: Optional[str] = None) -> str:
         if not ret:
             raise RuntimeError("Failed to capture frame")
         cv2.imwrite(output_path, frame)
-        try:
-            os.sync()
-        except Exception:
-            pass
+        flush_worker.persist(output_path)
         return output_path
     except Exception as exc:
         logger.exception("OpenCV 拍照失敗")
         raise RuntimeError("沒有可用的拍照後端") from exc
 
 
+class RemuxJob:
+    """單一 H.264 -> MP4 轉檔工作"""
+
+    def __init__(self, raw_path: str, final_path: str) -> None:
+        self.id = uuid.uuid4().hex[:8]
+        self.raw_path = raw_path
+        self.final_path = final_path
+        self.state = "queued"
+        self.progress = 0.0
+        self.error: Optional[str] = None
+        self.file: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def status(self) -> dict:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "progress": round(self.progress, 3),
+            "raw_file": self.raw_path,
+            "file": self.file or self.final_path,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class RemuxQueue:
+    """H.264 -> MP4 轉檔工作佇列
+
+    停止錄影時只把原始檔排入佇列,由單一背景執行緒依序執行 ffmpeg -c copy,
+    錄影器不必等待轉檔即可開始下一段。進度以輸出大小相對原始檔大小估算
+    (-c copy 輸出大小與輸入相近)。
+    """
+
+    def __init__(self) -> None:
+        self._queue: "queue.Queue[RemuxJob]" = queue.Queue()
+        self._jobs: "OrderedDict[str, RemuxJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, raw_path: str, final_path: str) -> RemuxJob:
+        job = RemuxJob(raw_path, final_path)
+        with self._lock:
+            self._jobs[job.id] = job
+            # 只淘汰已結束的舊工作
+            for job_id in list(self._jobs):
+                if len(self._jobs) <= REMUX_HISTORY:
+                    break
+                if self._jobs[job_id].state in ("done", "error"):
+                    del self._jobs[job_id]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+        logger.info(f"🔄 已排入轉檔工作 {job.id}: {raw_path}")
+        return job
+
+    def get(self, job_id: str) -> Optional[RemuxJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return [job.status() for job in self._jobs.values()]
+
+    def pending(self) -> int:
+        return self._queue.unfinished_tasks
+
+    def drain(self, timeout: float) -> bool:
+        """等待佇列中的轉檔完成 (服務結束前呼叫)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.1)
+        return self._queue.unfinished_tasks == 0
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                self._remux(job)
+            finally:
+                self._queue.task_done()
+
+    def _remux(self, job: RemuxJob) -> None:
+        job.state = "running"
+        try:
+            if not os.path.exists(job.raw_path):
+                raise FileNotFoundError(f"原始檔案不存在: {job.raw_path}")
+            raw_size = max(os.path.getsize(job.raw_path), 1)
+            # 先讓原始檔落盤,轉檔失敗或斷電時仍保有完整影片 (已在背景執行緒,直接同步)
+            if flush_worker.policy_for(job.raw_path) != "none":
+                fsync_file(job.raw_path)
+
+            cmd = [
+                "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+                "-nostats", "-progress", "pipe:1",
+                "-r", str(DEFAULT_FPS),
+                "-i", job.raw_path,
+                "-c", "copy",
+                job.final_path
+            ]
+            logger.info(f"🔄 轉換 H264 為 MP4: {' '.join(cmd)}")
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            timer = threading.Timer(REMUX_TIMEOUT, proc.kill)
+            timer.start()
+            try:
+                for line in proc.stdout:
+                    if line.startswith("total_size="):
+                        try:
+                            job.progress = min(1.0, int(line.split("=", 1)[1]) / raw_size)
+                        except ValueError:
+                            pass
+                stderr = proc.stderr.read()
+                proc.wait()
+            finally:
+                timer.cancel()
+            if proc.returncode != 0:
+                raise RuntimeError(stderr.strip() or f"ffmpeg 結束碼 {proc.returncode} (可能逾時)")
+
+            # MP4 確實落盤後才刪除原始檔,斷電時至少保留其中一份
+            fsync_file(job.final_path)
+            try:
+                os.remove(job.raw_path)
+                logger.info(f"✅ 已刪除原始檔案: {job.raw_path}")
+                flush_worker.persist(job.raw_path, removed=True)
+            except Exception as e:
+                logger.warning(f"刪除原始檔失敗: {e}")
+
+            job.file = job.final_path
+            job.progress = 1.0
+            job.state = "done"
+            logger.info(f"✅ 轉檔工作 {job.id} 完成: {job.final_path}")
+        except Exception as e:
+            job.file = job.raw_path
+            job.error = str(e)
+            job.state = "error"
+            logger.error(f"❌ 轉檔工作 {job.id} 失敗: {e}")
+        finally:
+            job.finished_at = time.time()
+
+
+remux_queue = RemuxQueue()
+
+
 class VideoRecorder:
     """優化後的錄影類別 - 解決堵塞問題並修復 USB/exFAT 不寫入問題"""
 
@@ -369,6 +1030,7 @@ class VideoRecorder:
         self._raw_file_path: Optional[str] = None
         self._final_file_path: Optional[str] = None
         self._using_backend: str = "none"  # 統一後端標記
+        self._remux_job_id: Optional[str] = None  # 最近一次停止錄影排入的轉檔工作
 
         # picamera2 相關
         self._picam2 = None
@@ -393,6 +1055,8 @@ class VideoRecorder:
                 "raw_file": self._raw_file_path,
                 "file": self._final_file_path or self._raw_file_path,
                 "backend": self._using_backend,
+                "remux_job": self._remux_job_id,
+                "remux_pending": remux_queue.pending(),
             }
 
     def start(self, output_basename: Optional[str] = None, duration_seconds: Optional[int] = None) -> str:
@@ -403,21 +1067,27 @@ class VideoRecorder:
 
             # 準備檔案路徑
             base_name = output_basename or _timestamped_filename("video", "mp4")
-            base_name = os.path.splitext(base_name)[0]
+            base_name = _unique_video_basename(os.path.splitext(base_name)[0])
             output_mp4 = os.path.join(current_videos_dir, f"{base_name}.mp4")
             os.makedirs(os.path.dirname(output_mp4), exist_ok=True)
 
             logger.info(f"🎥 準備開始錄影: {output_mp4}")
 
-            # 優先使用 picamera2
-            if HAS_PICAMERA2:
-                return self._start_picamera2(base_name, output_mp4, duration_seconds)
-            elif HAS_LIBCAMERA:
-                return self._start_libcamera(base_name, output_mp4, duration_seconds)
-            elif HAS_FFMPEG:
-                return self._start_ffmpeg(output_mp4, duration_seconds)
-            else:
-                raise RuntimeError("No available backend for video recording")
+            # 錄影獨佔相機,先釋放常駐拍照工作階段
+            camera_manager.suspend()
+            try:
+                # 優先使用 picamera2
+                if HAS_PICAMERA2:
+                    return self._start_picamera2(base_name, output_mp4, duration_seconds)
+                elif HAS_LIBCAMERA:
+                    return self._start_libcamera(base_name, output_mp4, duration_seconds)
+                elif HAS_FFMPEG:
+                    return self._start_ffmpeg(output_mp4, duration_seconds)
+                else:
+                    raise RuntimeError("No available backend for video recording")
+            except Exception:
+                camera_manager.resume()
+                raise
 
     def _start_picamera2(self, base_name: str, output_mp4: str, duration_seconds: Optional[int]) -> str:
         try:
@@ -568,6 +1238,8 @@ class VideoRecorder:
         """停止錄影 - 優化版本,防止堵塞"""
         with self._lock:
             if not self.is_recording():
+                # 子進程可能已依 -t 自行結束,相機已空閒
+                camera_manager.resume()
                 raise RuntimeError("No active recording")
 
             logger.info("🛑 正在停止錄影...")
@@ -579,17 +1251,11 @@ class VideoRecorder:
                 self._stop_process()
 
             # 處理檔案轉換
-            final_path = self._finalize_file_if_needed()
-
-            # 在 finalization 後再強制 sync（雙重保險）
-            try:
-                time.sleep(0.5)
-                os.sync()
-            except Exception:
-                pass
+            final_path = self._schedule_finalize()
 
             # 重置狀態
             self._reset_state()
+            camera_manager.resume()
 
             logger.info(f"✅ 錄影已停止,檔案: {final_path}")
             return final_path
@@ -624,13 +1290,6 @@ class VideoRecorder:
         except Exception as e:
             logger.warning(f"picamera2 資源清理警告: {e}")
         finally:
-            # 等待一點時間讓 backend/ffmpeg flush
-            try:
-                time.sleep(1)
-                os.sync()
-                logger.info("💾 已強制同步磁碟寫入 (cleanup_picamera2)")
-            except Exception:
-                pass
             self._picam2 = None
             self._encoder = None
             self._output = None
@@ -668,59 +1327,26 @@ class VideoRecorder:
         except Exception as e:
             logger.error(f"停止進程時發生錯誤: {e}")
 
-        # 停止子進程後強制 sync
-        try:
-            time.sleep(0.5)
-            os.sync()
-        except Exception:
-            pass
-
-    def _finalize_file_if_needed(self) -> str:
-        """處理 H264 -> MP4 轉檔"""
+    def _schedule_finalize(self) -> str:
+        """排入 H264 -> MP4 轉檔工作後立即返回最終檔案路徑"""
+        self._remux_job_id = None
         if not self._raw_file_path:
             return self._final_file_path or ""
 
         # H264 -> MP4
         if self._raw_file_path.endswith(".h264") and self._final_file_path and HAS_FFMPEG:
-            try:
-                if not os.path.exists(self._raw_file_path):
-                    logger.warning(f"⚠️ 原始檔案不存在: {self._raw_file_path}")
-                    return self._raw_file_path
-
-                cmd = [
-                    "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-                    "-r", str(DEFAULT_FPS),
-                    "-i", self._raw_file_path,
-                    "-c", "copy",
-                    self._final_file_path
-                ]
-                logger.info(f"🔄 轉換 H264 為 MP4: {' '.join(cmd)}")
-                subprocess.run(cmd, check=True, timeout=60)
-
-                # 刪除原始檔
-                try:
-                    os.remove(self._raw_file_path)
-                    logger.info(f"✅ 已刪除原始檔案: {self._raw_file_path}")
-                except Exception as e:
-                    logger.warning(f"刪除原始檔失敗: {e}")
-
-                # 強制 sync
-                try:
-                    os.sync()
-                except Exception:
-                    pass
-
-                return self._final_file_path
-
-            except subprocess.TimeoutExpired:
-                logger.error("❌ ffmpeg 轉換超時")
+            if not os.path.exists(self._raw_file_path):
+                logger.warning(f"⚠️ 原始檔案不存在: {self._raw_file_path}")
                 return self._raw_file_path
-            except Exception as e:
-                logger.error(f"❌ 檔案轉換失敗: {e}")
-                return self._raw_file_path
-
-        return self._final_file_path or self._raw_file_path
+            # 原始檔於轉檔工作開始時 fsync,不在持有錄影鎖時同步整段影片
+            job = remux_queue.submit(self._raw_file_path, self._final_file_path)
+            self._remux_job_id = job.id
+            return self._final_file_path
 
+        final_path = self._final_file_path or self._raw_file_path
+        if final_path and os.path.exists(final_path):
+            flush_worker.persist(final_path)
+        return final_path
 
     def _reset_state(self) -> None:
         """重置錄影狀態"""
@@ -746,9 +1372,15 @@ def index():
         "endpoints": {
             "health": "GET /health",
             "photo": "POST /photo?filename=xxx",
+            "photo_burst": "POST /photo/burst?count=10&interval_ms=100",
+            "timelapse_start": "POST /timelapse/start?interval_ms=2000&count=100",
+            "timelapse_stop": "POST /timelapse/stop",
+            "timelapse_status": "GET /timelapse/status",
             "video_start": "POST /video/start?filename=xxx&duration=10",
             "video_stop": "POST /video/stop",
             "video_status": "GET /video/status",
+            "video_remux_jobs": "GET /video/remux",
+            "video_remux_job": "GET /video/remux/<job_id>",
             "media": "GET /media/<filename>"
         }
     }), 200
@@ -764,6 +1396,7 @@ def health() -> tuple:
             "ffmpeg": HAS_FFMPEG,
             "picamera2": HAS_PICAMERA2
         },
+        "camera": camera_manager.status(),
         "storage": {
             "media_root": current_media_root,
             "usb_mounted": is_usb_mounted()
@@ -788,6 +1421,84 @@ def api_photo() -> tuple:
         return jsonify({"status": "error", "message": str(exc)}), 500
 
 
+def _parse_capture_args(default_interval_ms: int) -> Tuple[Optional[int], float]:
+    """解析 count / interval_ms 參數,無效時拋出 ValueError"""
+    count = request.args.get("count")
+    interval_ms = int(request.args.get("interval_ms", default_interval_ms))
+    if interval_ms < 0:
+        raise ValueError("interval_ms must not be negative")
+    if count is None:
+        return None, interval_ms / 1000.0
+    count = int(count)
+    if count <= 0:
+        raise ValueError("count must be positive")
+    return count, interval_ms / 1000.0
+
+
+@app.post("/photo/burst")
+def api_photo_burst() -> tuple:
+    """連拍端點:完成後回傳所有檔案"""
+    try:
+        count, interval = _parse_capture_args(0)
+    except ValueError as exc:
+        return jsonify({"status": "error", "message": str(exc)}), 400
+    count = count or 1
+    if count > BURST_MAX_COUNT:
+        return jsonify({"status": "error", "message": f"count must not exceed {BURST_MAX_COUNT}"}), 400
+    if count * interval > BURST_MAX_DURATION:
+        return jsonify({
+            "status": "error",
+            "message": f"count * interval_ms must not exceed {int(BURST_MAX_DURATION * 1000)}ms, use /timelapse for longer captures"
+        }), 400
+
+    logger.info(f"📷 連拍請求 - 張數: {count}, 間隔: {interval * 1000:.0f}ms")
+    job = CaptureJob("burst", count, interval)
+    job.start()
+    job.wait()
+    if job.state == "error":
+        return jsonify({"status": "error", "message": job.error, **job.status()}), 500
+    return jsonify({"status": "ok", **job.status()}), 200
+
+
+@app.post("/timelapse/start")
+def api_timelapse_start() -> tuple:
+    """啟動縮時攝影端點 (未指定 count 時持續到停止)"""
+    global timelapse_job
+    try:
+        count, interval = _parse_capture_args(1000)
+    except ValueError as exc:
+        return jsonify({"status": "error", "message": str(exc)}), 400
+
+    with timelapse_lock:
+        if timelapse_job and timelapse_job.is_running():
+            return jsonify({"status": "error", "message": "Timelapse already in progress"}), 400
+        timelapse_job = CaptureJob("timelapse", count, interval)
+        timelapse_job.start()
+        logger.info(f"⏱️ 縮時攝影已啟動 - 間隔: {interval * 1000:.0f}ms, 張數: {count or '不限'}")
+        return jsonify({"status": "ok", **timelapse_job.status()}), 200
+
+
+@app.post("/timelapse/stop")
+def api_timelapse_stop() -> tuple:
+    """停止縮時攝影端點"""
+    with timelapse_lock:
+        job = timelapse_job
+        if not job or not job.is_running():
+            return jsonify({"status": "error", "message": "No active timelapse"}), 400
+        job.stop()
+        job.wait()
+        return jsonify({"status": "ok", **job.status()}), 200
+
+
+@app.get("/timelapse/status")
+def api_timelapse_status() -> tuple:
+    """縮時攝影狀態端點"""
+    job = timelapse_job
+    if not job:
+        return jsonify({"status": "ok", "state": "idle"}), 200
+    return jsonify({"status": "ok", **job.status()}), 200
+
+
 @app.post("/video/start")
 def api_video_start() -> tuple:
     """啟動錄影端點"""
@@ -836,7 +1547,8 @@ def api_video_stop() -> tuple:
     """停止錄影端點"""
     try:
         path = video_recorder.stop()
-        return jsonify({"status": "ok", "file": path}), 200
+        remux_job = video_recorder.status()["remux_job"]
+        return jsonify({"status": "ok", "file": path, "remux_job": remux_job, "ready": remux_job is None}), 200
     except Exception as exc:
         logger.exception("停止錄影失敗")
         return jsonify({"status": "error", "message": str(exc)}), 400
@@ -848,6 +1560,21 @@ def api_video_status() -> tuple:
     return jsonify({"status": "ok", **video_recorder.status()}), 200
 
 
+@app.get("/video/remux")
+def api_remux_jobs() -> tuple:
+    """轉檔工作列表端點"""
+    return jsonify({"status": "ok", "pending": remux_queue.pending(), "jobs": remux_queue.list()}), 200
+
+
+@app.get("/video/remux/<job_id>")
+def api_remux_job(job_id: str) -> tuple:
+    """單一轉檔工作狀態端點"""
+    job = remux_queue.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Unknown remux job"}), 404
+    return jsonify({"status": "ok", **job.status()}), 200
+
+
 @app.get("/media/<path:filename>")
 def get_media(filename: str):
     """獲取媒體檔案端點"""
@@ -876,6 +1603,10 @@ def main() -> None:
         logger.info("🚀 啟動 Media Server...")
         init_storage()
 
+        # 常駐模式下預先啟動相機,首次拍照不需等待初始化
+        if camera_manager.warm:
+            camera_manager.start()
+
         host = os.environ.get("MEDIA_SERVER_HOST", "0.0.0.0")
         port = int(os.environ.get("MEDIA_SERVER_PORT", "8770"))
 
@@ -0,0 +1,76 @@
+"""MJPEG 管道的增量式 JPEG 幀切割器"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+SOI_MARKER = b'\xff\xd8'  # JPEG 開始標記
+EOI_MARKER = b'\xff\xd9'  # JPEG 結束標記
+MAX_FRAME_SIZE = 4 * 1024 * 1024  # 超過此大小仍找不到結束標記視為損壞資料
+
+
+class JpegFrameParser:
+    """增量式 JPEG 幀切割器
+
+    以 bytearray 累積管道資料並記住掃描位置，每個位元組只掃描一次。
+    完成的幀以 memoryview 形式回傳且不複製：幀完成時直接把整個緩衝區
+    交給該幀，只將結束標記之後的少量剩餘資料搬到新的緩衝區。
+    跨越區塊邊界的標記會保留最後一個位元組，於下次餵入時重新比對。
+    """
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self._buf = bytearray()
+        self._start = -1  # 當前幀 SOI 位置，-1 表示尚未找到
+        self._scan = 0    # 下次掃描的起始位置
+        self.frames_parsed = 0
+        self.bytes_discarded = 0
+
+    def feed(self, data):
+        """餵入新資料，回傳本次完成的幀（memoryview 列表）"""
+        self._buf += data
+        buf = self._buf
+        frames = []
+
+        while True:
+            if self._start < 0:
+                start_idx = buf.find(SOI_MARKER, self._scan)
+                if start_idx < 0:
+                    # 丟棄雜訊，只保留最後一個位元組以防標記被切開
+                    if len(buf) > 1:
+                        self.bytes_discarded += len(buf) - 1
+                        del buf[:-1]
+                    self._scan = 0
+                    break
+                self._start = start_idx
+                self._scan = start_idx + 2
+
+            end_idx = buf.find(EOI_MARKER, self._scan)
+            if end_idx < 0:
+                if len(buf) - self._start > self.max_frame_size:
+                    logger.warning(f"JPEG 幀超過 {self.max_frame_size} 位元組仍未結束，丟棄緩衝區")
+                    self.bytes_discarded += len(buf)
+                    buf.clear()
+                    self._start = -1
+                    self._scan = 0
+                else:
+                    self._scan = max(len(buf) - 1, self._start + 2)
+                break
+
+            end = end_idx + 2
+            frames.append(memoryview(buf)[self._start:end])
+            self.frames_parsed += 1
+
+            # 已發出的幀保留原緩衝區，剩餘資料移到新緩衝區
+            buf = buf[end:]
+            self._buf = buf
+            self._start = -1
+            self._scan = 0
+
+        return frames
+
+    def reset(self):
+        """清除所有暫存資料"""
+        self._buf = bytearray()
+        self._start = -1
+        self._scan = 0
@@ -8,26 +8,129 @@ import signal
 import sys
 import time
 import math
+import struct
+import queue
+import itertools
+import threading
+import atexit
+import logging.handlers
 
-# 配置日誌
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('server.log')
-    ]
-)
+# 日誌配置
+LOG_FILE = 'server.log'
+LOG_MAX_BYTES = 5 * 1024 * 1024  # 單一日誌檔上限,超過後輪替
+LOG_BACKUP_COUNT = 3
+LOG_THROTTLE_INTERVAL = 1.0  # 熱路徑日誌每個類別每秒最多輸出一筆
+
+def setup_logging(level=logging.DEBUG):
+    """配置非同步日誌
+
+    事件迴圈只把記錄放進佇列 (QueueHandler),由 QueueListener 執行緒寫入
+    終端與輪替日誌檔,SD 卡寫入延遲不會阻塞控制路徑。
+    """
+    formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+    stream_handler = logging.StreamHandler()
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+    for handler in (stream_handler, file_handler):
+        handler.setFormatter(formatter)
+    
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level)
+    
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+log_listener = setup_logging()
 logger = logging.getLogger(__name__)
 
+class LogThrottle:
+    """熱路徑日誌節流
+
+    每個類別 (key) 在 interval 秒內最多輸出一筆,下一筆附上期間略過的筆數;
+    使用 %-style 參數,被略過或等級未啟用時不做字串格式化。
+    """
+    def __init__(self, interval=LOG_THROTTLE_INTERVAL):
+        self.interval = interval
+        self._last = {}
+        self._suppressed = {}
+    
+    def debug(self, key, msg, *args):
+        self.log(logging.DEBUG, key, msg, *args)
+    
+    def log(self, level, key, msg, *args):
+        if not logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        if now - self._last.get(key, -self.interval) < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return
+        self._last[key] = now
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            msg += f" (略過 {suppressed} 筆)"
+        logger.log(level, msg, *args)
+
+# 全局熱路徑日誌節流
+log_throttle = LogThrottle()
+
 # 硬體配置
 LED_PIN = 27
 SERVO_PIN = 22
 
+# 伺服馬達運動規劃配置
+SERVO_TICK_RATE = 50  # 運動規劃更新頻率 (Hz),與伺服 PWM 週期 (20ms) 一致
+SERVO_USE_WAVEFORM = False  # 以 pigpio 波形一次送出整段軌跡,Python 端只追蹤進度
+SERVO_PWM_PERIOD_US = 20000  # 波形模式的脈衝週期 (μs)
+
+# MAVLink I/O 配置
+MAVLINK_POLL_TIMEOUT = 0.005  # I/O 執行緒等待輸入訊息的最長時間 (秒),亦即輸出命令的最大延遲
+MAVLINK_MAX_DRAIN = 50  # 每輪最多連續處理的輸入訊息數,避免遙測洪流延誤輸出
+MAVLINK_PRIORITY_COMMAND = 0  # 啟動/解除、模式切換等命令
+MAVLINK_PRIORITY_NORMAL = 1
+
+# 遙測配置
+TELEMETRY_STREAM_RATE = 10  # 向 Pixhawk 請求的資料流頻率 (Hz)
+TELEMETRY_DEFAULT_RATE = 5  # 客戶端訂閱的預設推送頻率 (Hz)
+TELEMETRY_MAX_RATE = 20  # 客戶端可訂閱的最高推送頻率 (Hz)
+
+# 二進位協定 (小端序,於連線時以 {"type": "negotiate", "protocol": "binary"} 協商)
+BINARY_CONTROL = 0x01  # 控制: type, flags, seq, 客戶端時間戳, throttle, yaw, forward, lateral
+BINARY_ACK = 0x02  # 確認: type, flags, seq, 伺服器時間戳, 狀態 (ACK_OK/ACK_ERROR/ACK_STALE)
+BINARY_TELEMETRY = 0x03  # 遙測: 見 TELEMETRY_STRUCT
+BINARY_FLAG_ACK = 0x01  # 控制幀要求確認
+ACK_OK = 0
+ACK_ERROR = 1
+ACK_STALE = 2  # 序號比已處理的最新幀舊,已丟棄
+CONTROL_STRUCT = struct.Struct('<BBIdffff')
+ACK_STRUCT = struct.Struct('<BBIdB')
+# type, flags, seq, 時間戳, roll, pitch, yaw (度), lat, lon (1e-7 度), alt, relative_alt (m), heading (度),
+# voltage (V), battery_remaining (%), armed, gps_fix, satellites;未知值為 NaN 或 -1
+TELEMETRY_STRUCT = struct.Struct('<BBIdfffiiffffbBBB')
+
+# 控制幀序號配置
+CONTROL_ACK_INTERVAL = 1.0  # 帶序號的控制幀改為每隔此秒數批次確認一次
+
+# 硬體狀態快取配置
+HARDWARE_REFRESH_INTERVAL = 5.0  # 背景向 pigpiod 校正 LED/伺服狀態的間隔 (秒)
+
+# 狀態廣播配置
+STATE_BROADCAST_WINDOW = 0.05  # 狀態變化在此秒數內合併為一次推送
+
+# RC 覆寫配置
+RC_OVERRIDE_RATE = 50  # rc_channels_override 固定發送頻率 (Hz)
+RC_INPUT_TIMEOUT = 0.5  # 超過此秒數未收到控制輸入時搖桿回中
+RC_RELEASE_TIMEOUT = 3.0  # 超過此秒數未收到控制輸入時釋放覆寫,交還遙控器控制
+
 class HardwareManager:
     """統一管理所有硬體組件"""
     def __init__(self):
         self.master = None
+        self.mavlink_io = None
         self.servo = None
         self.pi = None
         self.connected_clients = set()
@@ -63,9 +166,31 @@ class HardwareManager:
             self.master = mavutil.mavlink_connection('/dev/ttyACM0', baud=115200)
             self.master.wait_heartbeat(timeout=5)
             logger.info("成功連接到 Pixhawk")
+            # 之後的序列埠讀寫全部交給 I/O 執行緒
+            self.mavlink_io = MAVLinkIO(self.master)
+            self.mavlink_io.add_listener(telemetry.handle_message)
+            self.mavlink_io.add_listener(state_bus.handle_message)
+            self.mavlink_io.start()
+            self._request_telemetry_streams()
         except Exception as e:
             logger.error(f"無法連接到 Pixhawk: {e}")
             self.master = None
+            self.mavlink_io = None
+    
+    def _request_telemetry_streams(self):
+        """請求 Pixhawk 以固定頻率送出所有資料流 (USB 連線預設可能不送)"""
+        target_system = self.master.target_system
+        target_component = self.master.target_component
+        self.mavlink_io.send(
+            lambda mav: mav.request_data_stream_send(
+                target_system,
+                target_component,
+                mavutil.mavlink.MAV_DATA_STREAM_ALL,
+                TELEMETRY_STREAM_RATE,
+                1
+            ),
+            description="request_data_stream"
+        )
     
     def _setup_led(self):
         """設置 LED"""
@@ -76,6 +201,7 @@ class HardwareManager:
             self.pi.write(LED_PIN, 1)
             time.sleep(0.1)
             self.pi.write(LED_PIN, 0)
+            hardware_state.led = False
             logger.info(f"LED 已初始化於 GPIO{LED_PIN}")
         except Exception as e:
             logger.error(f"LED 初始化失敗: {e}")
@@ -93,6 +219,9 @@ class HardwareManager:
         """清理所有資源"""
         logger.info("開始清理硬體資源...")
         
+        if self.mavlink_io:
+            self.mavlink_io.stop()
+        
         if self.servo:
             self.servo.cleanup()
         
@@ -104,25 +233,64 @@ class HardwareManager:
 # 全局硬體管理器
 hardware = HardwareManager()
 
+class ServoTrajectory:
+    """單段伺服軌跡:從起點位置與速度平滑過渡到目標並停止
+
+    起點靜止時依緩動函數插值;被新目標打斷而起點仍在運動時,
+    以三次 Hermite 曲線銜接目前速度,避免速度突變。
+    """
+    def __init__(self, start, target, duration, start_velocity, ease, start_time):
+        self.start = start
+        self.target = target
+        self.duration = max(duration, 1e-3)
+        self.start_velocity = start_velocity
+        self.ease = ease
+        self.start_time = start_time
+    
+    def position(self, now):
+        s = min(max((now - self.start_time) / self.duration, 0.0), 1.0)
+        if abs(self.start_velocity) < 1e-6:
+            return self.start + (self.target - self.start) * self.ease(s)
+        # Hermite:p(0)=start, p'(0)=start_velocity, p(1)=target, p'(1)=0
+        s2, s3 = s * s, s * s * s
+        return ((2 * s3 - 3 * s2 + 1) * self.start
+                + (s3 - 2 * s2 + s) * self.duration * self.start_velocity
+                + (-2 * s3 + 3 * s2) * self.target)
+    
+    def finished(self, now):
+        return now - self.start_time >= self.duration
+
 class CameraServo:
-    """使用 pigpio 的伺服馬達控制類"""
-    def __init__(self, pi, pin=22, min_pw=500, max_pw=2500, angle_min=-45.0, angle_max=90.0):
+    """使用 pigpio 的伺服馬達控制類
+
+    伺服由運動規劃任務獨佔,以 SERVO_TICK_RATE 固定頻率輸出;新目標可隨時加入,
+    會從目前的命令位置與速度平滑銜接,不再因為移動中而丟棄命令。
+    """
+    def __init__(self, pi, pin=22, min_pw=500, max_pw=2500, angle_min=-45.0, angle_max=90.0,
+                 use_waveform=SERVO_USE_WAVEFORM):
         self.pi = pi
         self.pin = pin
         self.min_pw = min_pw
         self.max_pw = max_pw
         self.angle_min = angle_min
         self.angle_max = angle_max
-        self.current_angle = 0.0
-        self.is_moving = False
+        self.current_angle = 0.0  # 目前命令位置
+        self.velocity = 0.0  # 目前命令速度 (度/秒)
+        self._last_pw = None
+        self._trajectory = None
+        self._arrival = None  # 目前軌跡完成時設定結果的 Future
+        self._wakeup = None
+        self._planner_task = None
+        self.use_waveform = use_waveform
+        self._wave_id = None
+        self._wave_trajectory = None  # 目前波形對應的軌跡
         self._setup()
     
     def _setup(self):
         """設置伺服馬達"""
         try:
             # 設置為初始位置 (0度)
-            initial_pw = self._angle_to_pw(0.0)
-            self.pi.set_servo_pulsewidth(self.pin, int(initial_pw))
+            self._write_angle(0.0)
             time.sleep(0.5)  # 等待穩定
             logger.info(f"伺服馬達設置完成 - Pin: {self.pin}, 範圍: [{self.angle_min}°, {self.angle_max}°]")
         except Exception as e:
@@ -154,6 +322,58 @@ class CameraServo:
             return 0.5 * (1 - math.cos(math.pi * t))
         return t
     
+    def _write_angle(self, angle):
+        """輸出角度,脈衝寬度未變時不呼叫 pigpio"""
+        pw = int(self._angle_to_pw(angle))
+        if pw != self._last_pw:
+            self.pi.set_servo_pulsewidth(self.pin, pw)
+            self._last_pw = pw
+        self.current_angle = angle
+    
+    def _start_wave(self, trajectory, now):
+        """將軌跡預先取樣為 20ms 週期的脈衝序列,交由 pigpiod 以 DMA 時序輸出"""
+        self._stop_wave()
+        mask = 1 << self.pin
+        periods = max(1, math.ceil((trajectory.start_time + trajectory.duration - now) * 1e6 / SERVO_PWM_PERIOD_US))
+        pulses = []
+        for i in range(1, periods + 1):
+            t = min(now + i * SERVO_PWM_PERIOD_US / 1e6, trajectory.start_time + trajectory.duration)
+            pw = int(self._angle_to_pw(trajectory.position(t)))
+            pulses.append(pigpio.pulse(mask, 0, pw))
+            pulses.append(pigpio.pulse(0, mask, SERVO_PWM_PERIOD_US - pw))
+        
+        # 伺服 PWM 與波形不可同時輸出同一腳位,波形期間先關閉伺服脈衝
+        self.pi.set_servo_pulsewidth(self.pin, 0)
+        self._last_pw = None
+        self.pi.set_mode(self.pin, pigpio.OUTPUT)
+        self.pi.wave_add_new()
+        self.pi.wave_add_generic(pulses)
+        self._wave_id = self.pi.wave_create()
+        self.pi.wave_send_once(self._wave_id)
+        self._wave_trajectory = trajectory
+    
+    def _stop_wave(self):
+        """中止並刪除目前波形 (被新目標打斷或到達終點時)"""
+        if self._wave_id is None:
+            return
+        try:
+            if self.pi.wave_tx_busy():
+                self.pi.wave_tx_stop()
+            self.pi.wave_delete(self._wave_id)
+        except Exception as e:
+            logger.warning(f"清除伺服波形失敗: {e}")
+        self._wave_id = None
+        self._wave_trajectory = None
+    
+    @property
+    def is_moving(self):
+        return self._trajectory is not None
+    
+    @property
+    def target_angle(self):
+        """目前移動的目標角度,靜止時為目前角度"""
+        return self._trajectory.target if self._trajectory else self.current_angle
+    
     def get_current_angle(self):
         """獲取當前角度"""
         try:
@@ -164,48 +384,115 @@ class CameraServo:
             pass
         return self.current_angle
     
-    async def move_to(self, target_angle, duration=0.8, steps=100, easing_mode='sine'):
-        """平滑移動到目標角度 (異步版本)"""
-        if self.is_moving:
-            logger.warning("伺服馬達正在移動中,跳過此次命令")
-            return False
-        
-        self.is_moving = True
-        
-        try:
-            start_angle = self.get_current_angle()
-            target_angle = max(min(target_angle, self.angle_max), self.angle_min)
-            
-            steps = max(1, int(steps))
-            step_delay = max(0.001, duration / steps)
-            
-            logger.info(f"伺服馬達移動: {start_angle:.1f}° → {target_angle:.1f}° (耗時 {duration}s, {easing_mode})")
+    def _ensure_planner(self):
+        if self._planner_task is None or self._planner_task.done():
+            self._wakeup = asyncio.Event()
+            self._planner_task = asyncio.create_task(self._run_planner())
+    
+    def _finish_trajectory(self, result):
+        self._trajectory = None
+        if self._arrival and not self._arrival.done():
+            self._arrival.set_result(result)
+        self._arrival = None
+    
+    async def _run_planner(self):
+        """運動規劃任務:以固定頻率依目前軌跡輸出位置"""
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / SERVO_TICK_RATE
+        last_tick = loop.time()
+        while True:
+            if self._trajectory is None:
+                self.velocity = 0.0
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                last_tick = loop.time()
+                continue
             
-            for i in range(steps + 1):
-                t = i / steps
-                te = self._ease(t, easing_mode)
-                angle = start_angle + (target_angle - start_angle) * te
-                pw = self._angle_to_pw(angle)
-                self.pi.set_servo_pulsewidth(self.pin, int(pw))
-                await asyncio.sleep(step_delay)
+            now = loop.time()
+            trajectory = self._trajectory
+            try:
+                previous = self.current_angle
+                angle = trajectory.target if trajectory.finished(now) else trajectory.position(now)
+                if not self.use_waveform:
+                    self._write_angle(angle)
+                elif trajectory.finished(now):
+                    # 波形結束後恢復伺服 PWM 保持終點位置
+                    self._stop_wave()
+                    self._write_angle(angle)
+                else:
+                    if trajectory is not self._wave_trajectory:
+                        self._start_wave(trajectory, now)
+                    self.current_angle = angle  # 波形輸出中,只依經過時間追蹤位置
+                self.velocity = (angle - previous) / max(now - last_tick, 1e-3)
+            except Exception as e:
+                if self.use_waveform:
+                    # 波形送出前伺服 PWM 已關閉,立即恢復輸出並以逐步輸出完成同一段移動
+                    logger.warning(f"伺服波形輸出失敗,改為逐步輸出: {e}")
+                    self._stop_wave()
+                    self.use_waveform = False
+                    try:
+                        self._write_angle(self.current_angle)
+                        continue
+                    except Exception as e:
+                        logger.error(f"恢復伺服輸出失敗: {e}")
+                logger.error(f"伺服馬達移動失敗: {e}")
+                self._finish_trajectory(False)
+                continue
+            last_tick = now
             
-            self.current_angle = target_angle
-            logger.info(f"伺服馬達到達目標位置: {target_angle:.1f}°")
+            if trajectory.finished(now):
+                logger.info(f"伺服馬達到達目標位置: {trajectory.target:.1f}°")
+                self.velocity = 0.0
+                self._finish_trajectory(True)
+                continue
+            await asyncio.sleep(interval)
+    
+    async def move_to(self, target_angle, duration=0.8, steps=None, easing_mode='sine', wait=True):
+        """平滑移動到目標角度 (異步版本)
+
+        可在移動中隨時呼叫,新目標會從目前位置與速度銜接,被打斷的移動以 False 結束。
+        wait 為 False 時設定目標後立即返回;steps 僅為相容保留,更新頻率固定為 SERVO_TICK_RATE。
+        """
+        self._ensure_planner()
+        target_angle = max(min(target_angle, self.angle_max), self.angle_min)
+        loop = asyncio.get_running_loop()
+        if self.use_waveform and self._wave_trajectory is not None:
+            # 依經過時間推算被打斷時的位置與速度,再以新軌跡銜接
+            now = loop.time()
+            self._stop_wave()
+            dt = 1.0 / SERVO_TICK_RATE
+            previous = self._trajectory.position(now - dt) if self._trajectory else self.current_angle
+            if self._trajectory:
+                self.current_angle = self._trajectory.position(now)
+                self.velocity = (self.current_angle - previous) / dt
+            self._write_angle(self.current_angle)  # 新波形送出前先以伺服 PWM 保持位置
+        
+        if self._trajectory is not None:
+            logger.info(f"伺服馬達移動中改變目標: {self._trajectory.target:.1f}° → {target_angle:.1f}°")
+            self._finish_trajectory(False)
+        else:
+            logger.info(f"伺服馬達移動: {self.current_angle:.1f}° → {target_angle:.1f}° (耗時 {duration}s, {easing_mode})")
+        
+        self._trajectory = ServoTrajectory(
+            self.current_angle, target_angle, duration, self.velocity,
+            lambda t: self._ease(t, easing_mode), loop.time()
+        )
+        arrival = loop.create_future()
+        self._arrival = arrival
+        self._wakeup.set()
+        
+        if not wait:
             return True
-            
-        except Exception as e:
-            logger.error(f"伺服馬達移動失敗: {e}")
-            return False
-        finally:
-            self.is_moving = False
+        return await arrival
     
     def set_angle(self, target_angle):
-        """立即設置角度 (同步版本,用於兼容)"""
+        """立即設置角度 (同步版本,用於兼容),會取消進行中的移動"""
         try:
             target_angle = max(min(target_angle, self.angle_max), self.angle_min)
-            pw = self._angle_to_pw(target_angle)
-            self.pi.set_servo_pulsewidth(self.pin, int(pw))
-            self.current_angle = target_angle
+            self._stop_wave()
+            self._finish_trajectory(False)
+            self._write_angle(target_angle)
+            self.velocity = 0.0
             logger.info(f"伺服角度已設置: {target_angle:.1f}°")
             return True
         except Exception as e:
@@ -213,11 +500,24 @@ class CameraServo:
             return False
     
     def get_angle(self):
-        """獲取角度 (兼容方法)"""
-        return self.get_current_angle()
+        """獲取目前命令角度 (本地記錄,不經 pigpiod)"""
+        return self.current_angle
+    
+    def sync_pulsewidth(self, pw):
+        """以背景讀回的脈衝寬度校正本地角度 (僅在靜止時套用)"""
+        if self.is_moving or pw <= 0 or pw == self._last_pw:
+            return
+        angle = self._pw_to_angle(pw)
+        logger.warning(f"伺服脈衝寬度與本地記錄不符 ({self._last_pw} → {pw}),角度校正為 {angle:.1f}°")
+        self._last_pw = pw
+        self.current_angle = angle
     
     def cleanup(self):
         """清理伺服馬達資源"""
+        if self._planner_task:
+            self._planner_task.cancel()
+            self._planner_task = None
+        self._stop_wave()
         try:
             # 關閉 PWM 輸出
             self.pi.set_servo_pulsewidth(self.pin, 0)
@@ -225,10 +525,103 @@ class CameraServo:
         except Exception as e:
             logger.error(f"伺服馬達清理失敗: {e}")
 
-class MAVLinkController:
-    """MAVLink 控制器"""
+class MAVLinkIO:
+    """MAVLink I/O 子系統,在專屬執行緒中獨佔序列埠
+
+    持續讀取輸入訊息並分派給監聽者,避免 Pixhawk 未讀取的遙測塞滿 USB CDC 緩衝區;
+    輸出命令經優先佇列送出 (啟動/解除與模式切換優先),RC 覆寫只保留最新一筆並排在命令之後。
+    事件迴圈只負責排入命令,不會被序列埠寫入阻塞。
+    """
     def __init__(self, master):
         self.master = master
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._rc_lock = threading.Lock()
+        self._rc_channels = None
+        self._listeners = []
+        self._running = False
+        self._thread = None
+        self.messages_received = 0
+    
+    def add_listener(self, callback):
+        """註冊輸入訊息監聽者,callback(msg) 於 I/O 執行緒中呼叫"""
+        self._listeners.append(callback)
+    
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="mavlink-io", daemon=True)
+        self._thread.start()
+        logger.info("MAVLink I/O 執行緒已啟動")
+    
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+    
+    def send(self, send_func, priority=MAVLINK_PRIORITY_NORMAL, description=""):
+        """排入輸出命令,send_func(mav) 於 I/O 執行緒中執行"""
+        self._queue.put((priority, next(self._counter), send_func, description))
+    
+    def set_rc_override(self, channels):
+        """設定下一筆要送出的 RC 覆寫,尚未送出的舊值直接被取代"""
+        with self._rc_lock:
+            self._rc_channels = channels
+    
+    def _run(self):
+        while self._running:
+            self._flush_outbound()
+            try:
+                msg = self.master.recv_match(blocking=True, timeout=MAVLINK_POLL_TIMEOUT)
+                drained = 0
+                while msg is not None:
+                    self._dispatch(msg)
+                    drained += 1
+                    if drained >= MAVLINK_MAX_DRAIN:
+                        break
+                    msg = self.master.recv_match(blocking=False)
+            except Exception as e:
+                logger.error(f"MAVLink 讀取錯誤: {e}")
+                time.sleep(0.1)
+    
+    def _dispatch(self, msg):
+        if msg.get_type() == 'BAD_DATA':
+            return
+        self.messages_received += 1
+        for callback in self._listeners:
+            try:
+                callback(msg)
+            except Exception as e:
+                logger.error(f"MAVLink 訊息處理錯誤: {e}")
+    
+    def _flush_outbound(self):
+        while True:
+            try:
+                _, _, send_func, description = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                send_func(self.master.mav)
+            except Exception as e:
+                logger.error(f"MAVLink 發送失敗 ({description}): {e}")
+        
+        with self._rc_lock:
+            channels, self._rc_channels = self._rc_channels, None
+        if channels is not None:
+            try:
+                self.master.mav.rc_channels_override_send(
+                    self.master.target_system,
+                    self.master.target_component,
+                    *channels
+                )
+            except Exception as e:
+                logger.error(f"發送 RC 覆寫失敗: {e}")
+
+class MAVLinkController:
+    """MAVLink 控制器,命令經 MAVLinkIO 排入佇列後立即返回"""
+    def __init__(self, mavlink_io):
+        self.io = mavlink_io
+        self.master = mavlink_io.master if mavlink_io else None
     
     def set_flight_mode(self, mode):
         """設置飛行模式"""
@@ -242,10 +635,15 @@ class MAVLinkController:
                 logger.error(f"未知模式: {mode}")
                 return False
             
-            self.master.mav.set_mode_send(
-                self.master.target_system,
-                mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED,
-                mode_id
+            target_system = self.master.target_system
+            self.io.send(
+                lambda mav: mav.set_mode_send(
+                    target_system,
+                    mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED,
+                    mode_id
+                ),
+                priority=MAVLINK_PRIORITY_COMMAND,
+                description=f"set_mode {mode}"
             )
             logger.info(f"已設置飛行模式為 {mode}")
             return True
@@ -260,12 +658,18 @@ class MAVLinkController:
             return False
         
         try:
-            self.master.mav.command_long_send(
-                self.master.target_system,
-                self.master.target_component,
-                mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
-                0,
-                1 if arm else 0, 0, 0, 0, 0, 0, 0
+            target_system = self.master.target_system
+            target_component = self.master.target_component
+            self.io.send(
+                lambda mav: mav.command_long_send(
+                    target_system,
+                    target_component,
+                    mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
+                    0,
+                    1 if arm else 0, 0, 0, 0, 0, 0, 0
+                ),
+                priority=MAVLINK_PRIORITY_COMMAND,
+                description="arm" if arm else "disarm"
             )
             logger.info(f"Pixhawk {'已啟動' if arm else '已解除'}")
             return True
@@ -286,16 +690,416 @@ class MAVLinkController:
             roll_pwm = int(1500 + lateral * 500)
             
             channels = [roll_pwm, pitch_pwm, throttle_pwm, yaw_pwm, 0, 0, 0, 0]
-            self.master.mav.rc_channels_override_send(
-                self.master.target_system,
-                self.master.target_component,
-                *channels
-            )
-            logger.debug(f"RC 通道設置完成")
+            self.io.set_rc_override(channels)
+            log_throttle.debug("rc_override", "RC 通道設置完成: %s", channels)
             return True
         except Exception as e:
             logger.error(f"設置 RC 通道失敗: {e}")
             return False
+    
+    def release_rc_channels(self):
+        """釋放 RC 覆寫 (通道值 0 表示交還遙控器)"""
+        if not self.master:
+            return False
+        self.io.set_rc_override([0] * 8)
+        logger.info("RC 覆寫已釋放,交還遙控器控制")
+        return True
+
+def is_autopilot_heartbeat(msg):
+    """判斷是否為所連接飛控的心跳 (排除地面站、雲台、機載電腦、ADS-B 等元件)"""
+    if msg.get_type() != 'HEARTBEAT':
+        return False
+    if msg.autopilot == mavutil.mavlink.MAV_AUTOPILOT_INVALID or msg.type == mavutil.mavlink.MAV_TYPE_GCS:
+        return False
+    master = hardware.master
+    return master is None or msg.get_srcSystem() == master.target_system
+
+class TelemetryCache:
+    """遙測最新值快取
+
+    由 MAVLink I/O 執行緒解析輸入訊息並寫入分組欄位 (attitude/position/battery/gps/hud/heartbeat),
+    數值在解析時四捨五入,使雜訊等級的變動不會觸發推送。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+    
+    def handle_message(self, msg):
+        """解析 MAVLink 訊息 (於 I/O 執行緒中呼叫)"""
+        msg_type = msg.get_type()
+        if msg_type == 'ATTITUDE':
+            group, fields = "attitude", {
+                "roll": round(math.degrees(msg.roll), 1),
+                "pitch": round(math.degrees(msg.pitch), 1),
+                "yaw": round(math.degrees(msg.yaw), 1),
+            }
+        elif msg_type == 'GLOBAL_POSITION_INT':
+            group, fields = "position", {
+                "lat": round(msg.lat / 1e7, 7),
+                "lon": round(msg.lon / 1e7, 7),
+                "alt": round(msg.alt / 1000.0, 1),
+                "relative_alt": round(msg.relative_alt / 1000.0, 1),
+                "heading": round(msg.hdg / 100.0, 1) if msg.hdg != 65535 else None,
+            }
+        elif msg_type == 'SYS_STATUS':
+            group, fields = "battery", {
+                "voltage": round(msg.voltage_battery / 1000.0, 2),
+                "current": round(msg.current_battery / 100.0, 1) if msg.current_battery != -1 else None,
+                "remaining": msg.battery_remaining if msg.battery_remaining != -1 else None,
+            }
+        elif msg_type == 'GPS_RAW_INT':
+            group, fields = "gps", {
+                "fix_type": msg.fix_type,
+                "satellites": msg.satellites_visible,
+            }
+        elif msg_type == 'VFR_HUD':
+            group, fields = "hud", {
+                "groundspeed": round(msg.groundspeed, 1),
+                "climb": round(msg.climb, 1),
+                "throttle": msg.throttle,
+            }
+        elif msg_type == 'HEARTBEAT':
+            # 只接受飛控的心跳,忽略地面站等其他元件
+            if not is_autopilot_heartbeat(msg):
+                return
+            group, fields = "heartbeat", {
+                "armed": bool(msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED),
+                "mode": mavutil.mode_string_v10(msg),
+                "system_status": msg.system_status,
+            }
+        else:
+            return
+        
+        with self._lock:
+            self._values.setdefault(group, {}).update(fields)
+    
+    def get(self, group):
+        """取得單一分組的副本"""
+        with self._lock:
+            return dict(self._values.get(group, {}))
+    
+    def snapshot(self):
+        """取得目前所有遙測值的副本"""
+        with self._lock:
+            return {group: dict(fields) for group, fields in self._values.items()}
+
+# 全局遙測快取
+telemetry = TelemetryCache()
+
+def pack_telemetry(seq, values):
+    """將遙測快取打包為固定長度的二進位幀"""
+    nan = float('nan')
+    attitude = values.get("attitude", {})
+    position = values.get("position", {})
+    battery = values.get("battery", {})
+    gps = values.get("gps", {})
+    heartbeat = values.get("heartbeat", {})
+    
+    def value(fields, key, default=nan):
+        v = fields.get(key)
+        return default if v is None else v
+    
+    return TELEMETRY_STRUCT.pack(
+        BINARY_TELEMETRY, 0, seq & 0xFFFFFFFF, time.time(),
+        value(attitude, "roll"), value(attitude, "pitch"), value(attitude, "yaw"),
+        int(value(position, "lat", 0) * 1e7), int(value(position, "lon", 0) * 1e7),
+        value(position, "alt"), value(position, "relative_alt"), value(position, "heading"),
+        value(battery, "voltage"), value(battery, "remaining", -1),
+        int(value(heartbeat, "armed", False)), value(gps, "fix_type", 0), value(gps, "satellites", 0)
+    )
+
+async def telemetry_pusher(session, rate, groups=None):
+    """依客戶端要求的頻率推送遙測,只送出自上次推送後有變動的欄位
+
+    二進位模式下送出固定長度的 TELEMETRY_STRUCT,內容完全未變時略過。
+    """
+    interval = 1.0 / rate
+    last_sent = {}
+    last_packed = None
+    seq = 0
+    while True:
+        if session.binary:
+            values = telemetry.snapshot()
+            # 時間戳以外的內容未變則略過
+            packed = pack_telemetry(seq, values)
+            body = packed[:2] + packed[14:]
+            if body != last_packed:
+                last_packed = body
+                seq += 1
+                await session.websocket.send(packed)
+        else:
+            diff = {}
+            for group, fields in telemetry.snapshot().items():
+                if groups and group not in groups:
+                    continue
+                sent = last_sent.setdefault(group, {})
+                changed = {k: v for k, v in fields.items() if k not in sent or sent[k] != v}
+                if changed:
+                    sent.update(changed)
+                    diff[group] = changed
+            
+            if diff:
+                await session.websocket.send(json.dumps({"type": "telemetry", "timestamp": time.time(), "data": diff}))
+        await asyncio.sleep(interval)
+
+class ClientSession:
+    """單一控制客戶端的連線狀態"""
+    def __init__(self, websocket, client_id):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.telemetry_task = None
+        self.binary = False  # 是否已協商二進位協定
+        self.control_ack = True  # 二進位控制幀是否一律回覆確認
+        # 控制幀序號追蹤:比最新序號舊的幀直接丟棄
+        self.last_control_seq = None
+        self.control_received = 0
+        self.control_dropped = 0
+        self.ack_task = None
+    
+    def accept_control(self, seq):
+        """檢查控制幀序號,比已處理的最新序號舊 (或重複) 時回傳 False
+
+        序號為 32 位元無號整數,以序列號算術處理回繞。
+        """
+        if self.last_control_seq is not None:
+            delta = (seq - self.last_control_seq) & 0xFFFFFFFF
+            if delta == 0 or delta >= 0x80000000:
+                self.control_dropped += 1
+                return False
+        self.last_control_seq = seq & 0xFFFFFFFF
+        self.control_received += 1
+        if self.ack_task is None:
+            self.ack_task = asyncio.create_task(self._periodic_ack())
+        return True
+    
+    async def _periodic_ack(self):
+        """定期批次確認已處理的最新控制幀序號,取代逐幀回覆"""
+        reported = (0, 0)
+        while True:
+            await asyncio.sleep(CONTROL_ACK_INTERVAL)
+            counts = (self.control_received, self.control_dropped)
+            if counts == reported:
+                continue
+            reported = counts
+            await self.websocket.send(json.dumps({
+                "type": "control_ack",
+                "seq": self.last_control_seq,
+                "received": self.control_received,
+                "dropped": self.control_dropped,
+                "timestamp": time.time()
+            }))
+    
+    def subscribe_telemetry(self, rate, groups=None):
+        """(重新) 訂閱遙測推送"""
+        self.unsubscribe_telemetry()
+        self.telemetry_task = asyncio.create_task(telemetry_pusher(self, rate, groups))
+    
+    def unsubscribe_telemetry(self):
+        if self.telemetry_task:
+            self.telemetry_task.cancel()
+            self.telemetry_task = None
+    
+    def close(self):
+        self.unsubscribe_telemetry()
+        if self.ack_task:
+            self.ack_task.cancel()
+            self.ack_task = None
+
+class RCOverrideLoop:
+    """固定頻率 RC 覆寫發送器
+
+    控制訊息只更新最新搖桿狀態 (突發到達的訊息自然合併為最新值),
+    由獨立任務以固定頻率發送 rc_channels_override;輸入逾時則將搖桿回中,
+    逾時超過 release_timeout 或所有客戶端斷線時釋放覆寫並停止發送,讓遙控器取回控制。
+    """
+    def __init__(self, rate=RC_OVERRIDE_RATE, timeout=RC_INPUT_TIMEOUT, release_timeout=RC_RELEASE_TIMEOUT):
+        self.interval = 1.0 / rate
+        self.timeout = timeout
+        self.release_timeout = release_timeout
+        self._sticks = (0.0, 0.0, 0.0, 0.0)
+        self._last_input = None  # 尚未收到控制輸入或已釋放時不發送覆寫
+        self._stale = False
+        self._release_pending = False
+        self._task = None
+    
+    def update(self, throttle, yaw, forward, lateral):
+        """更新最新搖桿狀態 (各軸範圍 -1 ~ 1,非有限數值拋出 ValueError)"""
+        sticks = (throttle, yaw, forward, lateral)
+        if not all(math.isfinite(v) for v in sticks):
+            raise ValueError(f"搖桿數值必須為有限數值: {sticks}")
+        self._sticks = tuple(max(-1.0, min(1.0, v)) for v in sticks)
+        self._last_input = time.monotonic()
+        self._release_pending = False
+    
+    def release(self):
+        """停止覆寫,於下一個週期送出釋放值 (最後一個控制客戶端斷線時呼叫)"""
+        if self._last_input is not None:
+            self._last_input = None
+            self._release_pending = True
+    
+    def start(self, mavlink_controller):
+        """啟動發送任務"""
+        self._task = asyncio.create_task(self._run(mavlink_controller))
+        logger.info(f"RC 覆寫發送任務已啟動 ({1.0 / self.interval:.0f} Hz)")
+    
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+    
+    async def _run(self, mavlink_controller):
+        next_tick = time.monotonic()
+        while True:
+            if self._last_input is not None and time.monotonic() - self._last_input > self.release_timeout:
+                logger.warning(f"控制輸入逾時 ({self.release_timeout}s),釋放 RC 覆寫")
+                self._last_input = None
+                self._release_pending = True
+            
+            if self._release_pending and mavlink_controller.master:
+                mavlink_controller.release_rc_channels()
+                self._release_pending = False
+                self._stale = False
+            elif self._last_input is not None and mavlink_controller.master:
+                if time.monotonic() - self._last_input > self.timeout:
+                    if not self._stale:
+                        logger.warning(f"控制輸入逾時 ({self.timeout}s),搖桿回中")
+                        self._stale = True
+                    self._sticks = (0.0, 0.0, 0.0, 0.0)
+                else:
+                    self._stale = False
+                mavlink_controller.set_rc_channels(*self._sticks)
+            
+            # 以絕對時間排程避免累積漂移;落後時不追趕補發
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                next_tick = time.monotonic()
+                delay = 0
+            await asyncio.sleep(delay)
+
+# 全局 RC 覆寫發送器
+rc_override = RCOverrideLoop()
+
+class HardwareState:
+    """硬體狀態快取
+
+    LED 與伺服的命令值在寫入時記錄於本地,狀態查詢直接讀記憶體;
+    背景任務以 HARDWARE_REFRESH_INTERVAL 低頻向 pigpiod 讀回校正,
+    讀取在執行緒池進行,結果回到事件迴圈套用。
+    """
+    def __init__(self, interval=HARDWARE_REFRESH_INTERVAL):
+        self.interval = interval
+        self.led = False
+        self._task = None
+    
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"硬體狀態校正任務已啟動 (每 {self.interval}s)")
+    
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+    
+    @staticmethod
+    def _read():
+        """讀取 pigpiod 實際狀態 (阻塞,於執行緒池執行)"""
+        pi = hardware.pi
+        if not pi or not pi.connected:
+            return None
+        led = pi.read(LED_PIN) == 1
+        pw = pi.get_servo_pulsewidth(SERVO_PIN) if hardware.servo else 0
+        return led, pw
+    
+    def _apply(self, led, pw):
+        if led != self.led:
+            logger.warning(f"LED 狀態與本地記錄不符,校正為 {'ON' if led else 'OFF'}")
+            self.led = led
+        if hardware.servo:
+            hardware.servo.sync_pulsewidth(pw)
+        state_bus.notify()
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                result = await loop.run_in_executor(None, self._read)
+                if result:
+                    self._apply(*result)
+            except Exception as e:
+                logger.warning(f"硬體狀態校正失敗: {e}")
+
+# 全局硬體狀態快取
+hardware_state = HardwareState()
+
+class StateBroadcaster:
+    """狀態變化推送
+
+    LED、伺服目標角度、解鎖狀態與飛行模式變化時呼叫 notify(),
+    STATE_BROADCAST_WINDOW 內的多次變化合併為一次,只送出與上次推送不同的欄位。
+    訊息序列化一次後以 websockets.broadcast 發給所有控制客戶端,
+    帶有 "status": "ok" 讓現有客戶端直接套用 angle/led。
+    """
+    def __init__(self, window=STATE_BROADCAST_WINDOW):
+        self.window = window
+        self._loop = None
+        self._pending = None
+        self._last_sent = {}
+        self._flight_state = None
+    
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._last_sent = self.current_state()
+    
+    def stop(self):
+        if self._pending:
+            self._pending.cancel()
+            self._pending = None
+        self._loop = None
+    
+    def current_state(self):
+        heartbeat = telemetry.get("heartbeat")
+        return {
+            "led": hardware_state.led,
+            "angle": round(hardware.servo.target_angle, 1) if hardware.servo else 0,
+            "armed": heartbeat.get("armed"),
+            "mode": heartbeat.get("mode"),
+        }
+    
+    def handle_message(self, msg):
+        """MAVLink 監聽器 (於 I/O 執行緒中呼叫),解鎖狀態或模式改變時通知"""
+        if not is_autopilot_heartbeat(msg):
+            return
+        flight_state = (bool(msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED),
+                        mavutil.mode_string_v10(msg))
+        if flight_state != self._flight_state:
+            self._flight_state = flight_state
+            loop = self._loop
+            if loop:
+                loop.call_soon_threadsafe(self.notify)
+    
+    def notify(self):
+        """標記狀態已變化 (於事件迴圈中呼叫)"""
+        if self._loop is None or self._pending is not None:
+            return
+        self._pending = self._loop.call_later(self.window, self._flush)
+    
+    def _flush(self):
+        self._pending = None
+        state = self.current_state()
+        diff = {key: value for key, value in state.items() if self._last_sent.get(key) != value}
+        if not diff:
+            return
+        self._last_sent = state
+        if not hardware.connected_clients:
+            return
+        payload = json.dumps({"type": "state", "status": "ok", **diff}, separators=(',', ':'))
+        websockets.broadcast(hardware.connected_clients, payload)
+        logger.debug(f"狀態推送 {diff} 至 {len(hardware.connected_clients)} 個客戶端")
+
+# 全局狀態廣播
+state_bus = StateBroadcaster()
 
 class LEDController:
     """LED 控制器"""
@@ -307,6 +1111,8 @@ class LEDController:
                 logger.warning("pigpio 未連接")
                 return False
             hardware.pi.write(LED_PIN, 1 if state else 0)
+            hardware_state.led = bool(state)
+            state_bus.notify()
             logger.info(f"LED 狀態: {'ON' if state else 'OFF'}")
             return True
         except Exception as e:
@@ -320,9 +1126,10 @@ class LEDController:
             if not hardware.pi or not hardware.pi.connected:
                 logger.warning("pigpio 未連接")
                 return False
-            current = hardware.pi.read(LED_PIN)
-            new_state = 0 if current else 1
+            new_state = 0 if hardware_state.led else 1
             hardware.pi.write(LED_PIN, new_state)
+            hardware_state.led = new_state == 1
+            state_bus.notify()
             logger.info(f"LED 已切換為: {'ON' if new_state else 'OFF'}")
             return new_state == 1
         except Exception as e:
@@ -331,15 +1138,8 @@ class LEDController:
     
     @staticmethod
     def get_led_state():
-        """獲取 LED 狀態"""
-        try:
-            if not hardware.pi or not hardware.pi.connected:
-                return False
-            state = hardware.pi.read(LED_PIN) == 1
-            return state
-        except Exception as e:
-            logger.error(f"讀取 LED 狀態失敗: {e}")
-            return False
+        """獲取 LED 狀態 (本地快取)"""
+        return hardware_state.led
 
 async def initialize_servo():
     """初始化伺服馬達序列"""
@@ -360,7 +1160,7 @@ async def initialize_servo():
         LEDController.set_led(True)
         
         for angle, duration, easing in positions:
-            success = await hardware.servo.move_to(angle, duration=duration, steps=100, easing_mode=easing)
+            success = await hardware.servo.move_to(angle, duration=duration, easing_mode=easing)
             if not success:
                 logger.warning(f"無法移動伺服馬達到 {angle}°")
                 LEDController.set_led(False)
@@ -382,7 +1182,8 @@ async def handle_connection(websocket, path=None):
     logger.info(f"新客戶端連接: {client_id}")
     
     hardware.connected_clients.add(websocket)
-    mavlink_controller = MAVLinkController(hardware.master)
+    mavlink_controller = MAVLinkController(hardware.mavlink_io)
+    session = ClientSession(websocket, client_id)
     
     try:
         await websocket.send(json.dumps({
@@ -392,12 +1193,22 @@ async def handle_connection(websocket, path=None):
         }))
         
         async for message in websocket:
-            logger.debug(f"收到來自 {client_id} 的消息: {message}")
+            if isinstance(message, bytes):
+                try:
+                    await handle_binary_message(message, mavlink_controller, session)
+                    hardware.last_heartbeat_time = time.time()
+                except Exception as e:
+                    logger.error(f"處理二進位消息時出錯 {client_id}: {e}")
+                continue
+            
+            log_throttle.debug("ws_message", "收到來自 %s 的消息: %s", client_id, message)
             
             try:
                 data = json.loads(message)
-                response = await process_message(data, mavlink_controller)
-                await websocket.send(json.dumps(response))
+                response = await process_message(data, mavlink_controller, session)
+                # 帶序號的控制幀不逐幀回覆 (改為批次確認)
+                if response is not None:
+                    await websocket.send(json.dumps(response))
                 hardware.last_heartbeat_time = time.time()
                 
             except json.JSONDecodeError as e:
@@ -413,15 +1224,19 @@ async def handle_connection(websocket, path=None):
     except Exception as e:
         logger.error(f"客戶端 {client_id} 異常斷開: {e}")
     finally:
+        session.close()
         hardware.connected_clients.discard(websocket)
+        if not hardware.connected_clients:
+            # 沒有控制端時交還遙控器,不等待輸入逾時
+            rc_override.release()
         logger.info(f"客戶端 {client_id} 連接已清理")
 
-async def process_message(data, mavlink_controller):
+async def process_message(data, mavlink_controller, session=None):
     """處理收到的消息"""
     message_type = data.get("type")
     
     if message_type == "control":
-        return await handle_control_message(data, mavlink_controller)
+        return await handle_control_message(data, mavlink_controller, session)
     elif message_type == "command":
         return await handle_command_message(data, mavlink_controller)
     elif message_type == "servo_control":
@@ -433,26 +1248,129 @@ async def process_message(data, mavlink_controller):
             "angle": hardware.servo.get_angle() if hardware.servo else 0,
             "led": LEDController.get_led_state()
         }
+    elif message_type == "negotiate":
+        return handle_negotiate(data, session)
+    elif message_type == "telemetry_subscribe":
+        return handle_telemetry_subscribe(data, session)
+    elif message_type == "telemetry_unsubscribe":
+        if session:
+            session.unsubscribe_telemetry()
+        return {"status": "ok", "message": "已取消遙測訂閱"}
     else:
         return {"status": "error", "message": f"未知消息類型: {message_type}"}
 
-async def handle_control_message(data, mavlink_controller):
-    """處理控制消息"""
+def handle_negotiate(data, session):
+    """協商協定: {"type": "negotiate", "protocol": "binary", "control_ack": false}
+
+    二進位模式下控制幀與遙測改用固定格式的二進位幀,其他命令仍使用 JSON。
+    """
+    if session is None:
+        return {"status": "error", "message": "此連線不支援協定協商"}
+    protocol = data.get('protocol', 'json')
+    if protocol not in ('json', 'binary'):
+        return {"status": "error", "message": f"不支援的協定: {protocol}"}
+    
+    session.binary = protocol == 'binary'
+    session.control_ack = bool(data.get('control_ack', True))
+    logger.info(f"客戶端 {session.client_id} 使用 {protocol} 協定 (控制確認: {session.control_ack})")
+    return {
+        "status": "ok",
+        "protocol": protocol,
+        "control_ack": session.control_ack,
+        "formats": {
+            "control": {"type": BINARY_CONTROL, "struct": CONTROL_STRUCT.format, "size": CONTROL_STRUCT.size},
+            "ack": {"type": BINARY_ACK, "struct": ACK_STRUCT.format, "size": ACK_STRUCT.size},
+            "telemetry": {"type": BINARY_TELEMETRY, "struct": TELEMETRY_STRUCT.format, "size": TELEMETRY_STRUCT.size},
+        }
+    }
+
+async def handle_binary_message(message, mavlink_controller, session):
+    """處理二進位控制幀"""
+    if not session.binary:
+        await session.websocket.send(json.dumps({"status": "error", "message": "尚未協商二進位協定"}))
+        return
+    if len(message) != CONTROL_STRUCT.size or message[0] != BINARY_CONTROL:
+        logger.warning(f"無效的二進位幀來自 {session.client_id}: {len(message)} bytes")
+        return
+    
+    _, flags, seq, timestamp, throttle, yaw, forward, lateral = CONTROL_STRUCT.unpack(message)
+    ok = bool(mavlink_controller.master) and all(math.isfinite(v) for v in (throttle, yaw, forward, lateral))
+    if ok:
+        # 過時的搖桿位置不再執行
+        if not session.accept_control(seq):
+            status = ACK_STALE
+        else:
+            rc_override.update(throttle, yaw, forward, lateral)
+            status = ACK_OK
+    else:
+        status = ACK_ERROR
+    
+    if session.control_ack or flags & BINARY_FLAG_ACK:
+        await session.websocket.send(ACK_STRUCT.pack(BINARY_ACK, 0, seq, time.time(), status))
+
+def handle_telemetry_subscribe(data, session):
+    """處理遙測訂閱: {"type": "telemetry_subscribe", "rate": 5, "groups": ["attitude", "position"]}"""
+    if session is None:
+        return {"status": "error", "message": "此連線不支援遙測訂閱"}
+    try:
+        rate = float(data.get('rate', TELEMETRY_DEFAULT_RATE))
+    except (TypeError, ValueError) as e:
+        return {"status": "error", "message": f"無效的遙測頻率: {e}"}
+    rate = max(0.1, min(rate, TELEMETRY_MAX_RATE))
+    groups = data.get('groups')
+    groups = set(groups) if groups else None
+    
+    session.subscribe_telemetry(rate, groups)
+    logger.info(f"客戶端 {session.client_id} 訂閱遙測: {rate} Hz, 分組: {sorted(groups) if groups else '全部'}")
+    return {
+        "status": "ok",
+        "message": "遙測訂閱成功",
+        "rate": rate,
+        "groups": sorted(groups) if groups else None
+    }
+
+async def handle_control_message(data, mavlink_controller, session=None):
+    """處理控制消息
+
+    帶 "seq" 的控制幀為 fire-and-forget:比最新序號舊的幀直接丟棄,成功時不回覆,
+    由 ClientSession 定期送出 control_ack。未帶序號的舊版客戶端維持逐幀回覆。
+    """
     try:
         throttle = float(data.get('throttle', 0))
         yaw = float(data.get('yaw', 0))
         forward = float(data.get('forward', 0))
         lateral = float(data.get('lateral', 0))
+        if not all(math.isfinite(v) for v in (throttle, yaw, forward, lateral)):
+            raise ValueError("搖桿數值必須為有限數值")
+        seq = data.get('seq')
+        if seq is not None:
+            seq = int(seq)
         
-        success = mavlink_controller.set_rc_channels(throttle, yaw, forward, lateral)
+        if not mavlink_controller.master:
+            return {"status": "error", "message": "無 Pixhawk 連線"}
         
-        return {
-            "status": "ok" if success else "error",
-            "message": "控制命令已執行" if success else "控制命令執行失敗"
-        }
-    except ValueError as e:
+        if seq is not None and session is not None:
+            # 過時的搖桿位置不再執行
+            if session.accept_control(seq):
+                rc_override.update(throttle, yaw, forward, lateral)
+            return None
+        
+        # 只更新最新搖桿狀態,由 RC 覆寫任務以固定頻率發送
+        rc_override.update(throttle, yaw, forward, lateral)
+        
+        return {"status": "ok", "message": "控制命令已接收"}
+    except (TypeError, ValueError) as e:
         return {"status": "error", "message": f"無效的控制參數: {e}"}
 
+def set_log_level(level_name):
+    """執行期調整日誌等級"""
+    level = logging.getLevelName(str(level_name).upper())
+    if not isinstance(level, int):
+        return {"status": "error", "message": f"無效日誌等級: {level_name}"}
+    logging.getLogger().setLevel(level)
+    logger.warning(f"日誌等級已設為 {logging.getLevelName(level)}")
+    return {"status": "ok", "level": logging.getLevelName(level), "message": f"日誌等級: {logging.getLevelName(level)}"}
+
 async def handle_command_message(data, mavlink_controller):
     """處理命令消息"""
     action = data.get('action')
@@ -474,18 +1392,19 @@ async def handle_command_message(data, mavlink_controller):
     
     elif action == "LED_ON":
         success = LEDController.set_led(True)
-        current_led_state = LEDController.get_led_state()
-        return {"status": "ok" if success else "error", "led": current_led_state, "message": "LED ON" if success else "Failed to turn LED ON"}
+        return {"status": "ok" if success else "error", "led": hardware_state.led, "message": "LED ON" if success else "Failed to turn LED ON"}
     
     elif action == "LED_OFF":
         success = LEDController.set_led(False)
-        current_led_state = LEDController.get_led_state()
-        return {"status": "ok" if success else "error", "led": current_led_state, "message": "LED OFF" if success else "Failed to turn LED OFF"}
+        return {"status": "ok" if success else "error", "led": hardware_state.led, "message": "LED OFF" if success else "Failed to turn LED OFF"}
     
     elif action == "LED_TOGGLE":
-        new_state = LEDController.toggle_led()
-        current_led_state = LEDController.get_led_state()
-        return {"status": "ok", "led": current_led_state, "message": f"LED {'ON' if current_led_state else 'OFF'}"}
+        LEDController.toggle_led()
+        led = hardware_state.led
+        return {"status": "ok", "led": led, "message": f"LED {'ON' if led else 'OFF'}"}
+    
+    elif action == "SET_LOG_LEVEL":
+        return set_log_level(data.get('level'))
     
     elif action == "REQUEST_SERVO_ANGLE":
         angle = hardware.servo.get_angle() if hardware.servo else 0
@@ -506,7 +1425,6 @@ async def handle_servo_message(data):
     try:
         angle = float(data.get('angle', 0))
         duration = float(data.get('duration', 0.8))
-        steps = int(data.get('steps', 100))
         easing = data.get('easing', 'sine')
         
         if not (hardware.servo.angle_min <= angle <= hardware.servo.angle_max):
@@ -516,12 +1434,13 @@ async def handle_servo_message(data):
                 "angle": hardware.servo.get_angle()
             }
         
-        # 使用異步平滑移動
-        success = await hardware.servo.move_to(angle, duration=duration, steps=steps, easing_mode=easing)
+        # 設定新目標後立即返回,由運動規劃任務平滑銜接 (拖動滑桿時可連續追蹤)
+        success = await hardware.servo.move_to(angle, duration=duration, easing_mode=easing, wait=False)
+        state_bus.notify()
         
         return {
             "status": "ok" if success else "error",
-            "angle": hardware.servo.get_angle(),
+            "angle": angle,
             "message": "角度設置成功" if success else "角度設置失敗"
         }
         
@@ -547,6 +1466,11 @@ async def main():
     # 初始化伺服馬達
     await initialize_servo()
     
+    # 啟動固定頻率 RC 覆寫發送
+    rc_override.start(MAVLinkController(hardware.mavlink_io))
+    hardware_state.start()
+    state_bus.start()
+    
     # 啟動 WebSocket 服務器
     try:
         server = await websockets.serve(
@@ -569,6 +1493,9 @@ async def main():
     except Exception as e:
         logger.error(f"服務器運行錯誤: {e}")
     finally:
+        rc_override.stop()
+        hardware_state.stop()
+        state_bus.stop()
         hardware.cleanup()
 
 if __name__ == "__main__":
@@ -10,7 +10,10 @@ import sys
 import numpy as np
 import subprocess
 import os
+import collections
 import fcntl
+import struct
+import termios
 import mediapipe as mp
 import asyncio
 import websockets
@@ -18,6 +21,8 @@ import json
 from datetime import datetime
 from typing import Optional
 
+from mjpeg_parser import JpegFrameParser
+
 # 設置日誌
 logging.basicConfig(
     level=logging.DEBUG,
@@ -33,25 +38,59 @@ logger = logging.getLogger(__name__)
 HOST = '0.0.0.0'
 PORT = 8000
 WS_PORT = 8001  # WebSocket 通訊埠
+HTTP_PORT = 8002  # HTTP MJPEG (multipart/x-mixed-replace) 通訊埠
+MJPEG_BOUNDARY = 'frame'
+
+# 連線上限配置
+MAX_STREAM_CLIENTS = 10  # 串流（TCP 與 HTTP 合計）同時連線上限
+MAX_WS_CLIENTS = 10  # WebSocket 同時連線上限
+STREAM_WRITE_BUFFER = 256 * 1024  # 每個串流客戶端的使用者層寫入緩衝上限，超過時等待排空
+STREAM_STALL_TIMEOUT = 5.0  # 串流客戶端連續這麼多秒無法送出任何幀時視為已斷線並關閉
+STREAM_KEEPALIVE_IDLE = 5  # TCP keepalive：閒置秒數、探測間隔、失敗次數
+STREAM_KEEPALIVE_INTERVAL = 2
+STREAM_KEEPALIVE_COUNT = 3
+
+# 幀廣播配置
+FRAME_RING_SIZE = 4  # 環形緩衝區保留的幀數，落後超過此數的客戶端會直接丟棄舊幀
+PIPE_READ_SIZE = 65536  # 每次從相機管道讀取的最大位元組數
+
+# 自適應串流配置
+LATENCY_BUDGET = 0.3  # 每個客戶端送出佇列允許的最大延遲（秒）
+ADAPTIVE_MIN_FPS = 1  # 壅塞時每個客戶端的最低送出幀率
+
+# 相機管線配置
+PIPELINE_MODE = 'mjpeg'  # 'mjpeg': rpicam-vid 直接輸出 MJPEG；'ffmpeg': rpicam-vid YUV420 + FFmpeg 編碼
+PIPELINE_STARTUP_CHECK = 1.0  # 啟動後等待此秒數確認 rpicam-vid 未立即結束
+PIPELINE_RESTART_MIN_DELAY = 1.0  # 管線非預期結束後的首次重啟等待（秒），連續失敗時加倍
+PIPELINE_RESTART_MAX_DELAY = 30.0
+PIPELINE_STABLE_SECONDS = 10.0  # 管線運行超過此秒數後結束視為偶發，重啟等待重置
+
+# 串流設定檔：解析度、幀率與 JPEG 品質（1-100）統一在此定義，兩種管線共用
+STREAM_PROFILES = {
+    'low_latency': {'width': 424, 'height': 240, 'framerate': 30, 'quality': 70},
+    'normal': {'width': 640, 'height': 480, 'framerate': 15, 'quality': 80},
+    'inspection': {'width': 1280, 'height': 720, 'framerate': 10, 'quality': 90},
+}
+DEFAULT_STREAM_PROFILE = 'normal'
 
 # 手勢辨識配置
 GESTURE_COOLDOWN = 3  # 手勢觸發冷卻時間（秒）
+GESTURE_INFERENCE_FPS = 5  # 手勢推論最高頻率，與串流幀率無關
+GESTURE_INFERENCE_SIZE = (320, 240)  # MediaPipe 推論解析度 (寬, 高)，None 表示使用原始解析度
 PHOTOS_DIR = os.path.join(os.path.dirname(__file__), "media", "photos")
 os.makedirs(PHOTOS_DIR, exist_ok=True)
 
-# 非阻塞設定
-def set_nonblocking(fd):
-    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
-    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
-
 class GestureRecognizer:
     """手勢辨識類別，負責偏測 V 字手勢和窪拇指"""
-    def __init__(self):
+    def __init__(self, inference_size=GESTURE_INFERENCE_SIZE):
         self.enabled = False
         self.last_photo_time = 0
         self.hands = None
         self.mp_hands = mp.solutions.hands
-        self.mp_draw = mp.solutions.drawing_utils
+        self.inference_size = inference_size
+        # 預先配置的縮放與色彩轉換緩衝區，避免每幀配置新陣列
+        self._resize_buffer = None
+        self._rgb_buffer = None
         self.setup_hands()
         
     def setup_hands(self):
@@ -79,21 +118,40 @@ class GestureRecognizer:
                 hand_landmarks.landmark[16].y > hand_landmarks.landmark[14].y and
                 hand_landmarks.landmark[20].y > hand_landmarks.landmark[18].y)
     
-    def process_frame(self, frame):
-        """處理影像幀並偵測手勢"""
+    def _prepare_input(self, frame):
+        """縮放到推論解析度並轉為 RGB，重複使用預先配置的緩衝區"""
+        if self.inference_size and (frame.shape[1], frame.shape[0]) != tuple(self.inference_size):
+            width, height = self.inference_size
+            if self._resize_buffer is None:
+                self._resize_buffer = np.empty((height, width, 3), dtype=np.uint8)
+            cv2.resize(frame, (width, height), dst=self._resize_buffer, interpolation=cv2.INTER_AREA)
+            frame = self._resize_buffer
+
+        if self._rgb_buffer is None or self._rgb_buffer.shape != frame.shape:
+            self._rgb_buffer = np.empty(frame.shape, dtype=np.uint8)
+        self._rgb_buffer.flags.writeable = True
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._rgb_buffer)
+        # 標記為唯讀，讓 MediaPipe 直接引用而不複製
+        self._rgb_buffer.flags.writeable = False
+        return self._rgb_buffer
+    
+    def process_frame(self, frame, output_size=None):
+        """處理影像幀並偵測手勢，回傳 (各手部標記點的像素座標列表, 手勢)
+
+        output_size 為標記點座標對應的完整畫面大小 (寬, 高)，預設為 frame 本身大小；
+        當 frame 是縮小解碼的影像時，座標仍會換算回完整畫面。
+        """
         if not self.enabled:
-            return frame, None
-            
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.hands.process(frame_rgb)
+            return [], None
+        
+        width, height = output_size or (frame.shape[1], frame.shape[0])
+        results = self.hands.process(self._prepare_input(frame))
         
+        hands = []
         gesture_detected = None
         if results.multi_hand_landmarks:
             for hand_landmarks in results.multi_hand_landmarks:
-                # 繪製手部標記
-                self.mp_draw.draw_landmarks(
-                    frame, hand_landmarks, self.mp_hands.HAND_CONNECTIONS
-                )
+                hands.append([(int(lm.x * width), int(lm.y * height)) for lm in hand_landmarks.landmark])
                 
                 # 偵測手勢並檢查冷卻時間
                 current_time = time.time()
@@ -105,7 +163,16 @@ class GestureRecognizer:
                         gesture_detected = "thumbs_up"
                         self.last_photo_time = current_time
         
-        return frame, gesture_detected
+        return hands, gesture_detected
+    
+    def draw_landmarks(self, frame, hands):
+        """在完整解析度影像上繪製手部標記"""
+        for pixels in hands:
+            for start, end in self.mp_hands.HAND_CONNECTIONS:
+                cv2.line(frame, pixels[start], pixels[end], (255, 255, 255), 2)
+            for pixel in pixels:
+                cv2.circle(frame, pixel, 3, (0, 0, 255), -1)
+        return frame
     
     def capture_gesture_photo(self, frame, gesture_type):
         """保存手勢觸發的照片"""
@@ -121,13 +188,56 @@ class GestureRecognizer:
         logger.info(f"手勢拍照成功：{gesture_type} -> {filepath}")
         return filepath
 
-def start_pipeline():
+def _log_stderr(proc, name):
+    """記錄子進程的 stderr 輸出"""
+    for line in iter(proc.stderr.readline, b''):
+        print(f"{name} stderr: {line.decode().strip()}")
+
+def _ffmpeg_qscale(quality):
+    """將 1-100 的 JPEG 品質換算為 FFmpeg -q:v（2-31，數字越小質量越好）"""
+    return max(2, min(31, round((100 - quality) / 4)))
+
+def _start_direct_mjpeg(profile):
+    """rpicam-vid 直接輸出 MJPEG（硬體 JPEG 編碼），失敗時回傳 None"""
     rpicam_command = [
         'rpicam-vid',
         '-t', '0',
-        '--width', '640',  # 提高分辨率
-        '--height', '480',
-        '--framerate', '15',  # 提高幀率
+        '--width', str(profile['width']),
+        '--height', str(profile['height']),
+        '--framerate', str(profile['framerate']),
+        '--codec', 'mjpeg',
+        '--quality', str(profile['quality']),
+        '--nopreview',  # 關閉預覽以提高性能
+        '--timeout', '0',
+        '-o', '-'
+    ]
+
+    try:
+        rpicam_proc = subprocess.Popen(rpicam_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        logger.warning(f"無法啟動 rpicam-vid MJPEG 模式: {e}")
+        return None
+
+    # 不支援 MJPEG 或相機被佔用時 rpicam-vid 會很快結束
+    try:
+        rpicam_proc.wait(timeout=PIPELINE_STARTUP_CHECK)
+        logger.warning(f"rpicam-vid MJPEG 模式啟動失敗: {rpicam_proc.stderr.read().decode(errors='replace').strip()}")
+        return None
+    except subprocess.TimeoutExpired:
+        pass
+
+    threading.Thread(target=_log_stderr, args=(rpicam_proc, 'rpicam-vid'), daemon=True).start()
+    logger.info("串流管線: rpicam-vid 直接輸出 MJPEG")
+    return [rpicam_proc], rpicam_proc.stdout
+
+def _start_ffmpeg_chain(profile):
+    """rpicam-vid 輸出 YUV420，由 FFmpeg 軟體編碼為 MJPEG"""
+    rpicam_command = [
+        'rpicam-vid',
+        '-t', '0',
+        '--width', str(profile['width']),
+        '--height', str(profile['height']),
+        '--framerate', str(profile['framerate']),
         '--codec', 'yuv420',
         '--profile', 'baseline',
         '--nopreview',  # 關閉預覽以提高性能
@@ -142,11 +252,11 @@ def start_pipeline():
         'ffmpeg',
         '-f', 'rawvideo',
         '-pixel_format', 'yuv420p',
-        '-video_size', '640x480',  # 匹配新的分辨率
-        '-framerate', '15',  # 匹配新的幀率
+        '-video_size', f"{profile['width']}x{profile['height']}",
+        '-framerate', str(profile['framerate']),
         '-i', '-',
         '-f', 'mjpeg',
-        '-q:v', '5',  # 提高畫質（範圍1-31，數字越小質量越好）
+        '-q:v', str(_ffmpeg_qscale(profile['quality'])),
         '-preset', 'ultrafast',  # 使用最快的編碼速度
         '-tune', 'zerolatency',  # 優化低延遲
         '-an',
@@ -160,90 +270,623 @@ def start_pipeline():
         stderr=subprocess.PIPE,
         bufsize=10*1024*1024  # 增加緩衝區大小
     )
-
-    set_nonblocking(ffmpeg_proc.stdout.fileno())
+    # 管道已交給 FFmpeg，關閉本進程持有的讀取端
+    rpicam_proc.stdout.close()
 
     # 記錄 FFmpeg 和 rpicam-vid 錯誤
-    def log_stderr(proc, name):
-        for line in iter(proc.stderr.readline, b''):
-            print(f"{name} stderr: {line.decode().strip()}")
-    threading.Thread(target=log_stderr, args=(rpicam_proc, 'rpicam-vid'), daemon=True).start()
-    threading.Thread(target=log_stderr, args=(ffmpeg_proc, 'FFmpeg'), daemon=True).start()
+    threading.Thread(target=_log_stderr, args=(rpicam_proc, 'rpicam-vid'), daemon=True).start()
+    threading.Thread(target=_log_stderr, args=(ffmpeg_proc, 'FFmpeg'), daemon=True).start()
+    logger.info("串流管線: rpicam-vid YUV420 + FFmpeg MJPEG 編碼")
+    return [rpicam_proc, ffmpeg_proc], ffmpeg_proc.stdout
 
-    return rpicam_proc, ffmpeg_proc
+def start_pipeline(profile, mode=PIPELINE_MODE):
+    """依串流設定檔啟動相機管線，回傳 (子進程列表, MJPEG 輸出管道)
 
-def video_streamer(conn, ffmpeg_proc, addr, gesture_recognizer):
-    try:
-        # 設置 TCP 選項以優化傳輸
-        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-        conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 65536)  # 增加發送緩衝區
+    mode 為 'mjpeg' 時優先使用 rpicam-vid 直接輸出 MJPEG，失敗時自動退回
+    rpicam-vid + FFmpeg 的雙進程管線。
+    """
+    if mode == 'mjpeg':
+        pipeline = _start_direct_mjpeg(profile)
+        if pipeline is not None:
+            return pipeline
+        logger.warning("退回 rpicam-vid + FFmpeg 管線")
+    return _start_ffmpeg_chain(profile)
 
-        frame_buffer = b''
-        
+def stop_pipeline(procs):
+    """終止管線中的所有子進程"""
+    for proc in procs:
+        proc.kill()
+    for proc in procs:
+        proc.wait()
+
+class FrameBroadcaster:
+    """幀廣播器：單一讀取者發布完整 JPEG 幀，任意數量的訂閱者各自依速度讀取
+
+    publish() 由讀取執行緒呼叫，訂閱者則在事件迴圈中以 await get_frame() 取幀；
+    新幀到達時透過 call_soon_threadsafe 喚醒所有等待中的訂閱者。
+    """
+    def __init__(self, loop, ring_size=FRAME_RING_SIZE):
+        self._loop = loop
+        self._ring = collections.deque(maxlen=ring_size)
+        self._lock = threading.Lock()
+        self._new_frame = asyncio.Event()
+        self._seq = 0
+        self.closed = False
+
+    @property
+    def latest_seq(self):
+        """最新一幀的序號"""
+        with self._lock:
+            return self._seq
+
+    def _wake(self):
+        # set() 會立即喚醒目前所有等待者，clear() 讓之後的等待者等下一幀
+        self._new_frame.set()
+        self._new_frame.clear()
+
+    def publish(self, frame):
+        """發布新幀（可從任意執行緒呼叫），不會因為慢速客戶端而阻塞"""
+        with self._lock:
+            self._seq += 1
+            self._ring.append((self._seq, frame))
+        self._loop.call_soon_threadsafe(self._wake)
+
+    async def get_frame(self, last_seq, latest=False):
+        """取得 last_seq 之後的下一幀
+
+        若訂閱者落後超過環形緩衝區長度，則跳到緩衝區中最舊的幀（丟棄更舊的幀）；
+        latest 為 True 時直接取最新一幀（壅塞的訂閱者使用）。
+        廣播器關閉時回傳 (last_seq, None)。
+        """
         while True:
+            with self._lock:
+                if self.closed:
+                    return last_seq, None
+                if self._seq > last_seq:
+                    if latest:
+                        return self._ring[-1]
+                    oldest_seq = self._ring[0][0]
+                    return self._ring[max(last_seq + 1 - oldest_seq, 0)]
+            await self._new_frame.wait()
+
+    def close(self):
+        """關閉廣播器並喚醒所有訂閱者（可從任意執行緒呼叫）"""
+        with self._lock:
+            self.closed = True
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake)
+
+# JPEG 縮小解碼倍率對應的 imdecode 旗標
+_REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+class GestureWorker:
+    """背景手勢推論工作者
+
+    讀取執行緒以 submit() 投遞原始幀到單一槽位的信箱，新幀直接覆蓋尚未處理的舊幀
+    （latest-wins）。工作者最多每秒執行 max_fps 次推論，推論延遲不會影響串流幀率。
+    最新結果保存在 latest_result 供串流端繪製或轉發。
+    """
+    def __init__(self, recognizer, max_fps=GESTURE_INFERENCE_FPS):
+        self.recognizer = recognizer
+        self.interval = 1.0 / max_fps
+        self._mailbox_cond = threading.Condition()
+        self._mailbox = None
+        self._seq = 0
+        self._running = False
+        self._result_lock = threading.Lock()
+        self._latest_result = None
+        self._listeners = []
+        self._thread = None
+        # 完整畫面大小與縮小解碼倍率，依推論解析度自動選擇
+        self._frame_size = None
+        self._decode_scale = 1
+        self._reduced_size = None
+
+    @property
+    def latest_result(self):
+        """最新推論結果 {"seq", "timestamp", "frame_size", "hands", "gesture"}，尚無結果時為 None"""
+        with self._result_lock:
+            return self._latest_result
+
+    def add_listener(self, callback):
+        """註冊推論結果回呼，於推論執行緒中呼叫"""
+        self._listeners.append(callback)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._mailbox_cond:
+            self._running = False
+            self._mailbox_cond.notify_all()
+
+    def submit(self, jpeg_frame):
+        """投遞最新幀，覆蓋尚未處理的舊幀"""
+        with self._mailbox_cond:
+            self._seq += 1
+            self._mailbox = (self._seq, jpeg_frame)
+            self._mailbox_cond.notify()
+
+    def _take(self, timeout=1.0):
+        """取出信箱中的幀，逾時回傳 None"""
+        with self._mailbox_cond:
+            if not self._mailbox_cond.wait_for(lambda: not self._running or self._mailbox, timeout):
+                return None
+            item, self._mailbox = self._mailbox, None
+            return item
+
+    def _run(self):
+        while self._running:
+            if not self.recognizer.enabled:
+                with self._result_lock:
+                    self._latest_result = None
+                time.sleep(self.interval)
+                continue
+
+            started = time.monotonic()
+            item = self._take()
+            if item is None:
+                continue
+            seq, jpeg_frame = item
+
             try:
-                data = ffmpeg_proc.stdout.read(8192)  # 增加讀取緩衝區大小
-                if not data:
-                    time.sleep(0.005)  # 減少等待時間
-                    continue
-                    
-                # 如果啟用手勢辨識，處理影像庀
-                if gesture_recognizer.enabled:
-                    frame_buffer += data
-                    
-                    # 簡單的 JPEG 庀分離邏輯（尋找 JPEG 標記）
-                    start_marker = b'\xff\xd8'  # JPEG 開始標記
-                    end_marker = b'\xff\xd9'    # JPEG 結束標記
-                    
-                    start_idx = frame_buffer.find(start_marker)
-                    if start_idx != -1:
-                        end_idx = frame_buffer.find(end_marker, start_idx)
-                        if end_idx != -1:
-                            # 提取完整的 JPEG 庀
-                            jpeg_frame = frame_buffer[start_idx:end_idx + 2]
-                            frame_buffer = frame_buffer[end_idx + 2:]
-                            
-                            # 解碼并處理手勢辨識
-                            try:
-                                frame_array = np.frombuffer(jpeg_frame, dtype=np.uint8)
-                                frame = cv2.imdecode(frame_array, cv2.IMREAD_COLOR)
-                                
-                                if frame is not None:
-                                    processed_frame, gesture = gesture_recognizer.process_frame(frame)
-                                    
-                                    if gesture:
-                                        # 保存手勢照片
-                                        gesture_recognizer.capture_gesture_photo(processed_frame, gesture)
-                                        
-                                        # 可以在這裡發送 WebSocket 通知給主控制器
-                                        logger.info(f"偵測到手勢: {gesture}，已觸發拍照")
-                                    
-                                    # 重新編碼處理後的庀
-                                    _, encoded_frame = cv2.imencode('.jpg', processed_frame, 
-                                                                   [cv2.IMWRITE_JPEG_QUALITY, 85])
-                                    data = encoded_frame.tobytes()
-                            except Exception as e:
-                                logger.error(f"手勢辨識處理錯誤: {e}")
-                                # 使用原始數據
-                                pass
-                
-                conn.sendall(data)
-                print(f"Sent {len(data)} bytes to {addr}")
-            except (BlockingIOError, BrokenPipeError, ConnectionResetError):
+                self._infer(seq, jpeg_frame)
+            except Exception as e:
+                logger.error(f"手勢辨識處理錯誤: {e}")
+
+            # 限制推論頻率
+            remaining = self.interval - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def _select_decode_scale(self, frame_size):
+        """選擇不低於推論解析度的最大 JPEG 縮小解碼倍率"""
+        self._frame_size = frame_size
+        self._decode_scale = 1
+        inference_size = self.recognizer.inference_size
+        if inference_size:
+            for scale in (8, 4, 2):
+                if (frame_size[0] // scale >= inference_size[0]
+                        and frame_size[1] // scale >= inference_size[1]):
+                    self._decode_scale = scale
+                    break
+        self._reduced_size = (-(-frame_size[0] // self._decode_scale),
+                              -(-frame_size[1] // self._decode_scale))
+
+    def _decode_for_inference(self, jpeg_frame):
+        """以縮小倍率解碼 JPEG（libjpeg 在解碼時直接縮放，遠比完整解碼後再縮小便宜）"""
+        frame_array = np.frombuffer(jpeg_frame, dtype=np.uint8)
+        if self._frame_size is not None:
+            frame = cv2.imdecode(frame_array, _REDUCED_DECODE_FLAGS[self._decode_scale])
+            if frame is not None and (frame.shape[1], frame.shape[0]) == self._reduced_size:
+                return frame
+
+        # 首次解碼或解析度已改變：完整解碼並重新選擇倍率
+        frame = cv2.imdecode(frame_array, cv2.IMREAD_COLOR)
+        if frame is not None:
+            self._select_decode_scale((frame.shape[1], frame.shape[0]))
+        return frame
+
+    def _infer(self, seq, jpeg_frame):
+        """解碼並推論單一幀，發布結果"""
+        frame = self._decode_for_inference(jpeg_frame)
+        if frame is None:
+            return
+
+        hands, gesture = self.recognizer.process_frame(frame, output_size=self._frame_size)
+        result = {
+            "seq": seq,
+            "timestamp": time.time(),
+            "frame_size": self._frame_size,
+            "hands": hands,
+            "gesture": gesture,
+        }
+        with self._result_lock:
+            previous, self._latest_result = self._latest_result, result
+
+        # 連續沒有偵測到手時不重複通知
+        if hands or gesture or (previous and previous["hands"]):
+            for callback in self._listeners:
+                try:
+                    callback(result)
+                except Exception as e:
+                    logger.error(f"手勢結果回呼錯誤: {e}")
+
+        if gesture:
+            # 以完整解析度保存手勢照片
+            if self._decode_scale != 1:
+                frame = cv2.imdecode(np.frombuffer(jpeg_frame, dtype=np.uint8), cv2.IMREAD_COLOR)
+            self.recognizer.draw_landmarks(frame, hands)
+            self.recognizer.capture_gesture_photo(frame, gesture)
+
+            logger.info(f"偵測到手勢: {gesture}，已觸發拍照")
+
+def frame_reader(source, broadcaster, gesture_worker):
+    """唯一的 MJPEG 管道讀取者：切出完整 JPEG 幀後發布到廣播器"""
+    parser = JpegFrameParser()
+
+    try:
+        while not broadcaster.closed:
+            data = source.read1(PIPE_READ_SIZE)
+            if not data:
+                logger.error("相機管線輸出已結束，停止讀取幀")
                 break
+
+            for jpeg_frame in parser.feed(data):
+                # 原始 JPEG 直接轉發；推論在背景執行，結果經 WebSocket 另行推送
+                if gesture_worker.recognizer.enabled:
+                    gesture_worker.submit(jpeg_frame)
+                broadcaster.publish(jpeg_frame)
+    except Exception as e:
+        logger.error(f"幀讀取錯誤: {e}")
+
+class CameraPipeline:
+    """相機管線管理：依串流設定檔啟動，切換設定檔時重新啟動管線
+
+    廣播器在重啟期間保持不變，已連線的訂閱者不需重新連線，只會短暫收不到新幀。
+    rpicam-vid / FFmpeg 非預期結束時以指數退避自動重新啟動同一設定檔。
+    """
+    def __init__(self, broadcaster, gesture_worker, profile=DEFAULT_STREAM_PROFILE, mode=PIPELINE_MODE):
+        self.broadcaster = broadcaster
+        self.gesture_worker = gesture_worker
+        self.profile = profile
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._procs = []
+        self._reader = None
+        self._stopping = False
+        self._generation = 0  # 每次啟動管線遞增，重啟等待中若已被切換或停止則放棄
+        self._restart_delay = PIPELINE_RESTART_MIN_DELAY
+        self._restart_wakeup = threading.Event()
+
+    def start(self):
+        with self._lock:
+            self._stopping = False
+            self._start_locked()
+
+    def _start_locked(self):
+        profile = STREAM_PROFILES[self.profile]
+        self._generation += 1
+        self._restart_wakeup.clear()
+        self._procs, source = start_pipeline(profile, self.mode)
+        self._reader = threading.Thread(target=self._read, args=(source, self._generation), daemon=True)
+        self._reader.start()
+        logger.info(f"串流設定檔: {self.profile} "
+                    f"({profile['width']}x{profile['height']}@{profile['framerate']}fps, 品質 {profile['quality']})")
+
+    def _stop_locked(self):
+        self._restart_wakeup.set()  # 喚醒等待重啟中的讀取執行緒使其結束
+        stop_pipeline(self._procs)
+        self._procs = []
+        if self._reader:
+            self._reader.join(timeout=2)
+            self._reader = None
+
+    def _read(self, source, generation):
+        started = time.monotonic()
+        frame_reader(source, self.broadcaster, self.gesture_worker)
+        if self._stopping or self.broadcaster.closed:
+            return
+        # 非預期結束時保留廣播器並重新啟動管線
+        if time.monotonic() - started > PIPELINE_STABLE_SECONDS:
+            self._restart_delay = PIPELINE_RESTART_MIN_DELAY
+        self._restart(generation)
+
+    def _restart(self, generation):
+        """以指數退避重新啟動管線（於讀取執行緒中執行）"""
+        while True:
+            delay = self._restart_delay
+            self._restart_delay = min(delay * 2, PIPELINE_RESTART_MAX_DELAY)
+            logger.warning(f"相機管線未運行，{delay:.1f} 秒後重新啟動")
+            if self._restart_wakeup.wait(delay) or self._stopping:
+                return
+            with self._lock:
+                if self._stopping or generation != self._generation:
+                    return
+                stop_pipeline(self._procs)
+                self._procs = []
+                try:
+                    self._start_locked()
+                    logger.info("相機管線已重新啟動")
+                    return
+                except Exception as e:
+                    logger.error(f"相機管線重新啟動失敗: {e}")
+                    generation = self._generation
+
+    def switch_profile(self, profile):
+        """切換串流設定檔並重新啟動管線（阻塞直到新管線啟動）"""
+        if profile not in STREAM_PROFILES:
+            raise ValueError(f"未知串流設定檔: {profile}")
+        with self._lock:
+            if profile == self.profile and self._procs:
+                return
+            logger.info(f"切換串流設定檔: {self.profile} -> {profile}")
+            self._stopping = True
+            self._stop_locked()
+            self.profile = profile
+            self._stopping = False
+            self._start_locked()
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+            self._stop_locked()
+
+def socket_backlog(conn):
+    """查詢核心送出緩衝區中尚未被對方確認的位元組數（Linux SIOCOUTQ），不支援時回傳 None"""
+    try:
+        return struct.unpack('i', fcntl.ioctl(conn.fileno(), termios.TIOCOUTQ, b'\0' * 4))[0]
+    except (OSError, ValueError):
+        # 連線已關閉時 fileno() 為 -1，ioctl 會拋出 ValueError
+        return None
+
+class AdaptiveRateController:
+    """單一客戶端的自適應送出控制
+
+    以送出佇列深度除以估計的排空速率（吞吐量）估算佇列延遲。延遲超過預算時丟棄幀，
+    並將送出間隔加倍（最低 min_fps）；延遲低於預算一半時逐步縮短間隔直到不再限速（AIMD）。
+    """
+    def __init__(self, latency_budget=LATENCY_BUDGET, min_fps=ADAPTIVE_MIN_FPS):
+        self.latency_budget = latency_budget
+        self.max_interval = 1.0 / min_fps
+        self.interval = 0.0  # 兩次送出之間的最短間隔，0 表示不限速
+        self.throughput = None  # 排空速率（位元組/秒，指數移動平均）
+        self.latency = 0.0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self._last_send = 0.0
+        self._last_backoff = 0.0
+        self._sent_backlog = None  # 上次送出後的佇列深度
+        self._sent_time = 0.0
+
+    @property
+    def congested(self):
+        return self.latency > self.latency_budget
+
+    def _estimate(self, backlog, now):
+        """以上次送出後佇列的排空量更新吞吐量與延遲估計"""
+        if backlog is None:
+            return
+        if self._sent_backlog and now > self._sent_time:
+            sample = (self._sent_backlog - backlog) / (now - self._sent_time)
+            # 佇列清空時樣本只是下限，只用來提高估計值
+            if backlog > 0 or self.throughput is None or sample > self.throughput:
+                sample = max(sample, 1.0)
+                self.throughput = sample if self.throughput is None else 0.7 * self.throughput + 0.3 * sample
+        if self.throughput:
+            self.latency = backlog / self.throughput
+        elif backlog == 0:
+            self.latency = 0.0
+
+    def should_send(self, backlog, now):
+        """判斷是否送出這一幀；回傳 False 表示丟棄"""
+        self._estimate(backlog, now)
+
+        if self.congested:
+            if now - self._last_backoff > self.latency_budget:
+                self.interval = min(max(self.interval * 2, 1.0 / 30), self.max_interval)
+                self._last_backoff = now
+            self.frames_dropped += 1
+            return False
+
+        if now - self._last_send < self.interval:
+            self.frames_dropped += 1
+            return False
+
+        if self.latency < self.latency_budget / 2 and self.interval:
+            self.interval = self.interval * 0.9 if self.interval > 1.0 / 60 else 0.0
+        return True
+
+    def on_sent(self, backlog, started, now):
+        """記錄一次送出；無法查詢佇列深度時以 sendall 阻塞時間作為延遲估計"""
+        self.frames_sent += 1
+        self._last_send = now
+        self._sent_backlog = backlog
+        self._sent_time = now
+        if backlog is None:
+            self.latency = now - started
+
+async def stream_frames(writer, broadcaster, multipart=False):
+    """將廣播器中的幀依客戶端自身速度送出，壅塞時丟幀以維持延遲預算
+
+    multipart 為 False 時直接送出串接的 JPEG（原始 TCP 串流），
+    為 True 時每幀加上 multipart/x-mixed-replace 的分隔線與 Content-Length。
+    """
+    addr = writer.get_extra_info('peername')
+    if len(stream_clients) >= MAX_STREAM_CLIENTS:
+        logger.warning(f"串流連線數已達上限 {MAX_STREAM_CLIENTS}，拒絕 {addr}")
+        writer.close()
+        return
+
+    stream_clients.add(writer)
+    logger.info(f"Stream client connected from {addr}")
+    dropped = 0
+    rate = AdaptiveRateController()
+    sock = writer.get_extra_info('socket')
+    stalled_since = None  # 連續丟幀開始的時間，成功送出後重置
+    try:
+        _configure_stream_socket(sock)
+        writer.transport.set_write_buffer_limits(high=STREAM_WRITE_BUFFER)
+
+        # 從最新一幀開始串流
+        last_seq = max(broadcaster.latest_seq - 1, 0)
+
+        while not writer.is_closing():
+            # 壅塞時直接跳到最新一幀，不補送舊幀
+            seq, frame = await broadcaster.get_frame(last_seq, latest=rate.congested)
+            if frame is None:
+                break
+
+            dropped += seq - last_seq - 1
+            last_seq = seq
+            now = time.monotonic()
+            if not rate.should_send(_stream_backlog(writer, sock), now):
+                # 對方消失時佇列永遠不會排空，一直丟幀會佔住連線名額直到核心重傳逾時
+                if stalled_since is None:
+                    stalled_since = now
+                elif now - stalled_since > STREAM_STALL_TIMEOUT:
+                    logger.warning(f"串流客戶端 {addr} 超過 {STREAM_STALL_TIMEOUT} 秒未能送出，關閉連線")
+                    break
+                continue
+
+            started = time.monotonic()
+            if multipart:
+                writer.writelines((_multipart_header(len(frame)), frame, b'\r\n'))
+            else:
+                writer.write(frame)
+            # 使用者層緩衝超過上限時在此等待，形成背壓；長時間無法排空視為斷線
+            await asyncio.wait_for(writer.drain(), timeout=STREAM_STALL_TIMEOUT)
+            stalled_since = None
+            rate.on_sent(_stream_backlog(writer, sock), started, time.monotonic())
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    except (asyncio.TimeoutError, TimeoutError):
+        # drain 逾時，或 TCP_USER_TIMEOUT 觸發的 ETIMEDOUT
+        logger.warning(f"串流客戶端 {addr} 超過 {STREAM_STALL_TIMEOUT} 秒未能排空，關閉連線")
     except Exception as e:
-        print(f"Streaming error for {addr}: {e}")
+        logger.error(f"Streaming error for {addr}: {e}")
     finally:
-        conn.close()
-        print(f"Client {addr} disconnected")
+        stream_clients.discard(writer)
+        writer.close()
+        logger.info(f"Stream client {addr} disconnected (sent {rate.frames_sent}, "
+                    f"skipped {dropped + rate.frames_dropped} frames)")
+
+def _configure_stream_socket(sock):
+    """設置串流連線的 TCP 選項：低延遲、較大發送緩衝，並讓核心及早偵測消失的對方"""
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 65536)  # 增加發送緩衝區
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # 以下選項僅 Linux 支援
+    for name, value in (('TCP_KEEPIDLE', STREAM_KEEPALIVE_IDLE),
+                        ('TCP_KEEPINTVL', STREAM_KEEPALIVE_INTERVAL),
+                        ('TCP_KEEPCNT', STREAM_KEEPALIVE_COUNT),
+                        ('TCP_USER_TIMEOUT', int(STREAM_STALL_TIMEOUT * 1000))):
+        if hasattr(socket, name):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+
+async def handle_stream_client(reader, writer, broadcaster):
+    """原始 TCP 串流：串接的 JPEG 幀"""
+    await stream_frames(writer, broadcaster)
+
+def _multipart_header(length):
+    return (f"--{MJPEG_BOUNDARY}\r\n"
+            f"Content-Type: image/jpeg\r\n"
+            f"Content-Length: {length}\r\n\r\n").encode()
+
+def _http_response(writer, status, content_type, body=b'', extra_headers=()):
+    headers = [f"HTTP/1.1 {status}", f"Content-Type: {content_type}",
+               "Cache-Control: no-cache, no-store", "Connection: close", *extra_headers]
+    if body is not None:
+        headers.append(f"Content-Length: {len(body)}")
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode())
+    if body:
+        writer.write(body)
+
+async def handle_http_client(reader, writer, broadcaster):
+    """HTTP MJPEG 端點
+
+    GET /stream   multipart/x-mixed-replace 串流，可直接在瀏覽器、ffmpeg、VLC 中開啟
+    GET /snapshot 單張最新 JPEG
+    與 TCP 串流共用同一個廣播器，不會增加編碼工作。
+    """
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # 略過其餘請求標頭
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=5)
+            if line in (b'\r\n', b'\n', b''):
+                break
+    except (asyncio.TimeoutError, ConnectionError):
+        writer.close()
+        return
+
+    parts = request_line.decode('latin-1').split()
+    method, path = (parts[0], parts[1].split('?', 1)[0]) if len(parts) >= 2 else ('', '')
+
+    if method != 'GET':
+        _http_response(writer, "405 Method Not Allowed", "text/plain", b"Method Not Allowed")
+    elif path in ('/', '/stream') and len(stream_clients) >= MAX_STREAM_CLIENTS:
+        # 在送出 200 標頭前檢查上限，避免客戶端收到空白的 200 回應
+        logger.warning(f"串流連線數已達上限 {MAX_STREAM_CLIENTS}，拒絕 {writer.get_extra_info('peername')}")
+        _http_response(writer, "503 Service Unavailable", "text/plain", b"Too many stream clients",
+                       extra_headers=("Retry-After: 5",))
+    elif path in ('/', '/stream'):
+        _http_response(writer, "200 OK", f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}", body=None)
+        await stream_frames(writer, broadcaster, multipart=True)
+        return
+    elif path == '/snapshot':
+        try:
+            seq, frame = await asyncio.wait_for(
+                broadcaster.get_frame(max(broadcaster.latest_seq - 1, 0), latest=True), timeout=5
+            )
+        except asyncio.TimeoutError:
+            frame = None
+        if frame is None:
+            _http_response(writer, "503 Service Unavailable", "text/plain", b"Stream unavailable")
+        else:
+            _http_response(writer, "200 OK", "image/jpeg", bytes(frame))
+    else:
+        _http_response(writer, "404 Not Found", "text/plain", b"Not Found")
+
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+    writer.close()
+
+def _stream_backlog(writer, sock):
+    """客戶端尚未送達的位元組數：asyncio 寫入緩衝加上核心送出佇列"""
+    if writer.is_closing():
+        return None
+    kernel_backlog = socket_backlog(sock)
+    if kernel_backlog is None:
+        return None
+    return writer.transport.get_write_buffer_size() + kernel_backlog
 
 # 全域手勢辨識器
 gesture_recognizer = GestureRecognizer()
 
+# 串流與 WebSocket 客戶端，以及共用的事件迴圈（手勢結果由推論執行緒跨執行緒推送）
+stream_clients = set()
+ws_clients = set()
+ws_loop = None
+
+# 全域相機管線，於 main() 中建立
+camera_pipeline = None
+
+def forward_gesture_result(result):
+    """將手勢結果序列化一次後推送給所有 WebSocket 客戶端，取代在影像上繪製並重新編碼
+
+    座標為完整畫面的像素座標，每隻手的 21 個標記點攤平為 [x0, y0, x1, y1, ...]。
+    """
+    if ws_loop is None or not ws_clients:
+        return
+    message = json.dumps({
+        "type": "gesture",
+        "seq": result["seq"],
+        "ts": round(result["timestamp"], 3),
+        "size": result["frame_size"],
+        "hands": [[coord for point in points for coord in point] for points in result["hands"]],
+        "gesture": result["gesture"],
+    }, separators=(',', ':'))
+    ws_loop.call_soon_threadsafe(websockets.broadcast, ws_clients, message)
+
 # WebSocket 處理器
-async def handle_websocket(websocket, path):
-    """處理 WebSocket 連接，接收手勢辨識控制指令"""
+async def handle_websocket(websocket, path=None):
+    """處理 WebSocket 連接，接收手勢辨識控制指令並推送手勢結果"""
+    if len(ws_clients) >= MAX_WS_CLIENTS:
+        logger.warning(f"WebSocket 連線數已達上限 {MAX_WS_CLIENTS}，拒絕 {websocket.remote_address}")
+        await websocket.close(code=1013, reason="Too many connections")
+        return
     logger.info(f"WebSocket client connected: {websocket.remote_address}")
+    ws_clients.add(websocket)
     try:
         async for message in websocket:
             try:
@@ -263,8 +906,26 @@ async def handle_websocket(websocket, path):
                 elif command == 'status':
                     await websocket.send(json.dumps({
                         "status": "success", 
-                        "gesture_enabled": gesture_recognizer.enabled
+                        "gesture_enabled": gesture_recognizer.enabled,
+                        "profile": camera_pipeline.profile if camera_pipeline else None,
+                        "profiles": STREAM_PROFILES
                     }))
+
+                elif command == 'set_profile':
+                    profile = data.get('profile')
+                    try:
+                        # 重啟管線會阻塞，放到執行緒池中執行
+                        await asyncio.get_running_loop().run_in_executor(
+                            None, camera_pipeline.switch_profile, profile
+                        )
+                        await websocket.send(json.dumps({
+                            "status": "success", "message": f"串流設定檔已切換為 {profile}", "profile": profile
+                        }))
+                    except ValueError as e:
+                        await websocket.send(json.dumps({"status": "error", "message": str(e)}))
+                    except Exception as e:
+                        logger.error(f"切換串流設定檔失敗: {e}")
+                        await websocket.send(json.dumps({"status": "error", "message": f"切換失敗: {e}"}))
                     
             except json.JSONDecodeError:
                 await websocket.send(json.dumps({"status": "error", "message": "Invalid JSON"}))
@@ -273,48 +934,52 @@ async def handle_websocket(websocket, path):
         logger.info(f"WebSocket client disconnected: {websocket.remote_address}")
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
+    finally:
+        ws_clients.discard(websocket)
 
-def start_websocket_server():
-    """啟動 WebSocket 服務器"""
-    return websockets.serve(handle_websocket, HOST, WS_PORT)
+async def serve():
+    """在單一事件迴圈上執行 TCP 串流與 WebSocket 服務；阻塞的管道讀取與推論各有專屬執行緒"""
+    global camera_pipeline, ws_loop
+    loop = asyncio.get_running_loop()
+    ws_loop = loop
 
-def main():
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server.bind((HOST, PORT))
-    server.listen(5)
-    print(f"Streaming server started on {HOST}:{PORT}")
-    print(f"WebSocket server will start on {HOST}:{WS_PORT}")
-
-    rpicam_proc, ffmpeg_proc = start_pipeline()
-    
-    # 啟動 WebSocket 服務器
-    def run_websocket():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        start_server = start_websocket_server()
-        loop.run_until_complete(start_server)
-        loop.run_forever()
-    
-    ws_thread = threading.Thread(target=run_websocket, daemon=True)
-    ws_thread.start()
-    print(f"WebSocket server started on {HOST}:{WS_PORT}")
+    # 單一讀取者將幀發布給所有客戶端
+    broadcaster = FrameBroadcaster(loop)
+    gesture_worker = GestureWorker(gesture_recognizer)
+    gesture_worker.add_listener(forward_gesture_result)
+    camera_pipeline = CameraPipeline(broadcaster, gesture_worker)
+    # 啟動檢查會阻塞，放到執行緒池中執行
+    await loop.run_in_executor(None, camera_pipeline.start)
+    gesture_worker.start()
+
+    stream_server = await asyncio.start_server(
+        lambda reader, writer: handle_stream_client(reader, writer, broadcaster),
+        HOST, PORT, reuse_address=True
+    )
+    logger.info(f"Streaming server started on {HOST}:{PORT}")
+    http_server = await asyncio.start_server(
+        lambda reader, writer: handle_http_client(reader, writer, broadcaster),
+        HOST, HTTP_PORT, reuse_address=True
+    )
+    logger.info(f"HTTP MJPEG server started on http://{HOST}:{HTTP_PORT}/stream")
+    ws_server = await websockets.serve(handle_websocket, HOST, WS_PORT)
+    logger.info(f"WebSocket server started on {HOST}:{WS_PORT}")
 
     try:
-        while True:
-            print("Waiting for connection...")
-            try:
-                conn, addr = server.accept()
-                print(f"Client connected from {addr}")
-                stream_thread = threading.Thread(target=video_streamer, args=(conn, ffmpeg_proc, addr, gesture_recognizer))
-                stream_thread.start()
-            except Exception as e:
-                print(f"Server error: {e}")
+        await stream_server.serve_forever()
     finally:
-        ffmpeg_proc.kill()
-        rpicam_proc.kill()
-        ffmpeg_proc.wait()
-        rpicam_proc.wait()
+        stream_server.close()
+        http_server.close()
+        ws_server.close()
+        await loop.run_in_executor(None, camera_pipeline.stop)
+        broadcaster.close()
+        gesture_worker.stop()
+
+def main():
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        logger.info("串流伺服器手動關閉")
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()